@@ -3,18 +3,110 @@ analysis.py
 
 Analysis of FTIR spectra collected using Nicolet iS50.
 
+Usage:
+    python src/analysis.py [config]
+    python src/analysis.py plot [config]
+
+The "plot" mode redraws the CO2 transmission-vs-pressure trends from
+outputs/results.sqlite alone, without reading or ratioing any spectra.
+
 Author: Shiqi Xu
 """
 
+import sys
 from pathlib import Path
 
 import numpy as np
 import matplotlib.pyplot as plt
 
+import config
+import results
 import spectra
+import uncertainty
+
+
+def plot_co2_transmission(
+    conn, sample_type, path_save, band_window=(2280, 2390)
+):
+    """Plots stored CO2 band transmission against pressure, without re-running the
+    analysis.
+
+    Args:
+        conn (sqlite3.Connection): Open results database connection.
+        sample_type (str): Sample gas, e.g. "air" or "argon".
+        path_save (pathlib.Path): Path to save output figure.
+        band_window (Tuple[float, float], optional): CO2 band integrated over.
+            Defaults to (2280, 2390).
+    """
+    df_co2 = results.query_scalars(
+        conn,
+        "co2_transmission_" + str(band_window[0]) + "_" + str(band_window[1]),
+        order_by="pressure_kpa",
+        gas=sample_type,
+    )
+    list_pressures = df_co2["pressure_kpa"].to_numpy()
+    list_co2_transmission = df_co2["value"].to_numpy()
+    list_co2_uncertainty = df_co2["uncertainty"].to_numpy(dtype=float)
+    plt.figure()
+    plt.plot(list_pressures, list_co2_transmission, "o")
+    plt.errorbar(
+        list_pressures,
+        list_co2_transmission,
+        xerr=2,
+        yerr=None if np.all(np.isnan(list_co2_uncertainty)) else list_co2_uncertainty,
+        fmt="none",
+    )  # pressure uncertainty = 2 kPa; transmission from bootstrap std. error
+    plt.title("% transmission over CO$_2$ peak in " + sample_type + ", by pressure")
+    plt.xlabel("Pressure (kPa)")
+    plt.ylabel("% Transmission")
+    plt.savefig(path_save)
+    plt.close()
+
 
 if __name__ == "__main__":
 
+    args = sys.argv[1:]
+    plot_only = len(args) > 0 and args[0] == "plot"
+    if plot_only:
+        args = args[1:]
+    analysis_config = config.load_config(args[0] if len(args) > 0 else None)
+    crop_min, crop_max = analysis_config["co2"]["crop_window"]
+    band_min, band_max = analysis_config["co2"]["band_window"]
+    label_start, label_stop = analysis_config["filenames"]["label_slice"]
+    sample_types = ["air", "argon"]
+
+    ## trends from stored results only
+    if plot_only:
+        figure_path = Path.cwd() / "outputs"
+        conn = results.connect(figure_path / "results.sqlite")
+        stored = results.query_scalars(
+            conn, "co2_transmission_" + str(band_min) + "_" + str(band_max)
+        )
+        if len(stored) == 0:
+            conn.close()
+            sys.exit(
+                "no stored CO2 transmission for "
+                + str(band_min)
+                + "-"
+                + str(band_max)
+                + " cm^-1; run 'python src/analysis.py' first"
+            )
+        try:
+            Path.mkdir(figure_path / "co2_absorption")
+        except OSError:
+            pass
+        for sample_type in sample_types:
+            plot_co2_transmission(
+                conn,
+                sample_type,
+                figure_path
+                / "co2_absorption"
+                / ("transmission_co2_peak_" + sample_type + "_by_pressure.png"),
+                band_window=(band_min, band_max),
+            )
+        conn.close()
+        sys.exit()
+
     data_path = Path.cwd() / "data" / "2022-01-25"
     data_files = []
     for csv_file in data_path.iterdir():
@@ -54,7 +146,8 @@ if __name__ == "__main__":
     except OSError:
         pass
 
-    sample_types = ["air", "argon"]
+    conn = results.connect(figure_path / "results.sqlite")
+
     for i in range(len(single_beam_bkgd_files)):
         bkgd = single_beam_bkgd_files[i]
         list_wavenumbers, list_transmission = [], []
@@ -64,18 +157,21 @@ if __name__ == "__main__":
             wavenumbers, transmission = spectra.background_ratio(bkgd, sample)
             list_wavenumbers.append(wavenumbers)
             list_transmission.append(transmission)
+            results.store_vector(
+                conn, sample, "transmission", transmission, wavenumbers
+            )
             pressure_labels.append(str(sample).split("_")[5])
             spectra.plot_spectrum(
                 wavenumbers,
                 transmission,
-                str(sample.name)[17:-13],
+                str(sample.name)[label_start:label_stop],
                 "Wavenumber (cm$^{-1}$)",
                 "% Transmission",
                 y_lim=(0, 100),
                 save_fig=True,
                 path_save=figure_path
                 / "bkgd_ratio"
-                / (str(sample.name)[17:-13] + ".png"),
+                / (str(sample.name)[label_start:label_stop] + ".png"),
             )
         spectra.overlay_spectra(
             list_wavenumbers,
@@ -91,14 +187,14 @@ if __name__ == "__main__":
             / (sample_types[i] + "_by_pressure.png"),
         )
 
-        ## CO2 absorption peak: 2200-2500 cm^{-1}
+        ## CO2 absorption peak: 2200-2500 cm^{-1} by default
         list_cropped_wavenumbers, list_cropped_transmission = [], []
         for j in range(len(list_wavenumbers)):
             start = 0
-            while list_wavenumbers[j][start] < 2200:
+            while list_wavenumbers[j][start] < crop_min:
                 start += 1
             end = start
-            while list_wavenumbers[j][end] < 2500:
+            while list_wavenumbers[j][end] < crop_max:
                 end += 1
             list_cropped_wavenumbers.append(list_wavenumbers[j][start:end])
             list_cropped_transmission.append(list_transmission[j][start:end])
@@ -116,33 +212,36 @@ if __name__ == "__main__":
             / ("co2_peak_" + sample_types[i] + "_by_pressure.png"),
         )
 
-        ## integrating to get total transmission over 2280-2390 cm^{-1}
-        list_pressures, list_co2_transmission = [], []
+        ## integrating to get total transmission over 2280-2390 cm^{-1} by default
         for j in range(len(list_cropped_wavenumbers)):
             co2_transmission = spectra.tot_transmission(
-                list_cropped_wavenumbers[j], list_cropped_transmission[j], 2280, 2390
+                list_cropped_wavenumbers[j],
+                list_cropped_transmission[j],
+                band_min,
+                band_max,
             )
-            list_co2_transmission.append(co2_transmission)
-            list_pressures.append(int(pressure_labels[j][:-3]))
-        plt.figure()
-        plt.plot(list_pressures, list_co2_transmission, "o")
-        plt.errorbar(
-            list_pressures,
-            list_co2_transmission,
-            xerr=2,
-            fmt="none",
-        )  # pressure uncertainty = 2 kPa
-        plt.title(
-            "% transmission over CO$_2$ peak in " + sample_types[i] + ", by pressure"
-        )
-        plt.xlabel("Pressure (kPa)")
-        plt.ylabel("% Transmission")
-        plt.savefig(
+            co2_bootstrap = uncertainty.bootstrap_transmission(
+                list_cropped_wavenumbers[j],
+                list_cropped_transmission[j],
+                band_min,
+                band_max,
+            )
+            results.store_scalar(
+                conn,
+                single_beam_sample_files[i][j],
+                "co2_transmission_" + str(band_min) + "_" + str(band_max),
+                co2_transmission,
+                uncertainty=co2_bootstrap["std_err"],
+            )
+
+        plot_co2_transmission(
+            conn,
+            sample_types[i],
             figure_path
             / "co2_absorption"
-            / ("transmission_co2_peak_" + sample_types[i] + "_by_pressure.png")
+            / ("transmission_co2_peak_" + sample_types[i] + "_by_pressure.png"),
+            band_window=(band_min, band_max),
         )
-        plt.close()
 
     ## exploring different resolutions
     res_filenames = [
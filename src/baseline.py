@@ -0,0 +1,204 @@
+"""
+baseline.py
+
+Automatic baseline correction for whole FTIR spectra: asymmetric least squares,
+iterative polynomial fitting and rolling-ball methods. All methods accept a single
+spectrum or a 2-D stack of spectra (one per row) sharing the same wavenumber axis,
+and need no per-spectrum initial guesses.
+
+Author: Shiqi Xu
+"""
+
+from typing import Tuple
+
+import numpy as np
+from scipy import linalg, ndimage, sparse
+
+METHODS = ("asls", "poly", "rolling_ball")
+
+
+def _orient(y_data: np.ndarray, direction: str) -> np.ndarray:
+    """Flips spectra so that features always point up, i.e. so that the baseline
+    is always fitted from below."""
+    if direction not in ("up", "down"):
+        raise ValueError("direction must be 'up' or 'down'")
+    y_data = np.atleast_2d(np.asarray(y_data, dtype=np.float64))
+    return -y_data if direction == "down" else y_data
+
+
+def _restore(
+    baselines: np.ndarray, y_data: np.ndarray, direction: str
+) -> np.ndarray:
+    """Undoes _orient, and returns a 1-D baseline for a 1-D input spectrum."""
+    if direction == "down":
+        baselines = -baselines
+    if np.ndim(y_data) == 1:
+        return baselines[0]
+    return baselines
+
+
+def _second_difference_bands(n_points: int) -> np.ndarray:
+    """Returns D^T D, D being the second-difference matrix, in the upper banded
+    storage used by scipy.linalg.solveh_banded."""
+    diff_op = sparse.diags(
+        [1.0, -2.0, 1.0], [0, 1, 2], shape=(n_points - 2, n_points), format="csc"
+    )
+    penalty = (diff_op.T @ diff_op).tocsc()
+    bands = np.zeros((3, n_points))
+    bands[0, 2:] = penalty.diagonal(2)
+    bands[1, 1:] = penalty.diagonal(1)
+    bands[2, :] = penalty.diagonal(0)
+
+    return bands
+
+
+def baseline_asls(
+    y_data: np.ndarray,
+    lam: float = 1e5,
+    p: float = 0.01,
+    n_iter: int = 10,
+    direction: str = "down",
+) -> np.ndarray:
+    """Estimates the baseline by asymmetric least squares (Eilers & Boelens, 2005).
+    Each iteration solves a pentadiagonal system with a banded Cholesky solver, so
+    cost is linear in the number of points.
+
+    Args:
+        y_data (np.ndarray[float]): Spectrum, or 2-D array of spectra (one per row).
+        lam (float, optional): Smoothness penalty. Defaults to 1e5.
+        p (float, optional): Asymmetry; weight given to points on the feature side
+            of the baseline. Defaults to 0.01.
+        n_iter (int, optional): Max. number of reweighting iterations. Defaults to 10.
+        direction (str, optional): "down" if features are absorption dips (e.g.
+            single-beam or % transmission spectra), "up" if they are peaks.
+            Defaults to "down".
+
+    Returns:
+        np.ndarray[float]: Baseline, same shape as y_data (2-D if input was 2-D).
+    """
+    y_oriented = _orient(y_data, direction)
+    n_points = y_oriented.shape[1]
+    penalty_bands = lam * _second_difference_bands(n_points)
+
+    baselines = np.empty_like(y_oriented)
+    for i, y_row in enumerate(y_oriented):
+        weights = np.ones(n_points)
+        for _ in range(n_iter):
+            system = penalty_bands.copy()
+            system[2] += weights
+            z_row = linalg.solveh_banded(system, weights * y_row, check_finite=False)
+            new_weights = np.where(y_row > z_row, p, 1 - p)
+            if np.array_equal(new_weights, weights):
+                break
+            weights = new_weights
+        baselines[i] = z_row
+
+    return _restore(baselines, y_data, direction)
+
+
+def baseline_poly(
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+    degree: int = 3,
+    n_iter: int = 100,
+    tol: float = 1e-3,
+    direction: str = "down",
+) -> np.ndarray:
+    """Estimates the baseline by iterative polynomial fitting (modified polyfit,
+    Lieber & Mahadevan-Jansen, 2003): after each least-squares fit, points on the
+    feature side of the fit are clipped to the fit. All spectra in a stack are
+    fitted together as one multi-right-hand-side least-squares problem.
+
+    Args:
+        x_data (np.ndarray[float]): Wavenumber data, shared by all spectra.
+        y_data (np.ndarray[float]): Spectrum, or 2-D array of spectra (one per row).
+        degree (int, optional): Polynomial degree. Defaults to 3.
+        n_iter (int, optional): Max. number of iterations. Defaults to 100.
+        tol (float, optional): Relative change in fit below which to stop.
+            Defaults to 1e-3.
+        direction (str, optional): "down" if features are absorption dips, "up" if
+            they are peaks. Defaults to "down".
+
+    Returns:
+        np.ndarray[float]: Baseline, same shape as y_data (2-D if input was 2-D).
+    """
+    y_work = _orient(y_data, direction).copy()
+    x_data = np.asarray(x_data, dtype=np.float64)
+    ## scale x to [-1, 1] to keep the Vandermonde matrix well-conditioned
+    x_scaled = (2 * x_data - (x_data[0] + x_data[-1])) / (x_data[-1] - x_data[0])
+    vander = np.polynomial.polynomial.polyvander(x_scaled, degree)
+    pinv = np.linalg.pinv(vander)
+
+    fit = vander @ (pinv @ y_work.T)
+    for _ in range(n_iter):
+        y_work = np.minimum(y_work, fit.T)
+        new_fit = vander @ (pinv @ y_work.T)
+        change = np.linalg.norm(new_fit - fit) / np.linalg.norm(fit)
+        fit = new_fit
+        if change < tol:
+            break
+
+    return _restore(fit.T, y_data, direction)
+
+
+def baseline_rolling_ball(
+    y_data: np.ndarray,
+    half_window: int = 100,
+    smooth_half_window: int = None,
+    direction: str = "down",
+) -> np.ndarray:
+    """Estimates the baseline with a rolling ball (flat structuring element), i.e.
+    a morphological opening, followed by moving-average smoothing. Vectorized over
+    a stack of spectra.
+
+    Args:
+        y_data (np.ndarray[float]): Spectrum, or 2-D array of spectra (one per row).
+        half_window (int, optional): Half-width of ball, in data points. Should be
+            wider than the widest feature. Defaults to 100.
+        smooth_half_window (int, optional): Half-width of smoothing window, in data
+            points. Defaults to half_window.
+        direction (str, optional): "down" if features are absorption dips, "up" if
+            they are peaks. Defaults to "down".
+
+    Returns:
+        np.ndarray[float]: Baseline, same shape as y_data (2-D if input was 2-D).
+    """
+    if smooth_half_window is None:
+        smooth_half_window = half_window
+    y_oriented = _orient(y_data, direction)
+    window = 2 * half_window + 1
+    eroded = ndimage.minimum_filter1d(y_oriented, window, axis=-1, mode="nearest")
+    opened = ndimage.maximum_filter1d(eroded, window, axis=-1, mode="nearest")
+    smoothed = ndimage.uniform_filter1d(
+        opened, 2 * smooth_half_window + 1, axis=-1, mode="nearest"
+    )
+
+    return _restore(smoothed, y_data, direction)
+
+
+def correct_baseline(
+    x_data: np.ndarray, y_data: np.ndarray, method: str = "asls", **kwargs
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Estimates and subtracts the baseline of one or more spectra.
+
+    Args:
+        x_data (np.ndarray[float]): Wavenumber data, shared by all spectra.
+        y_data (np.ndarray[float]): Spectrum, or 2-D array of spectra (one per row).
+        method (str, optional): One of "asls", "poly" or "rolling_ball".
+            Defaults to "asls".
+        **kwargs: Passed on to the baseline function of the chosen method.
+
+    Returns:
+        Tuple[np.ndarray[float], np.ndarray[float]]: Baseline-corrected spectra and
+            the baselines, each the same shape as y_data.
+    """
+    if method == "asls":
+        baselines = baseline_asls(y_data, **kwargs)
+    elif method == "poly":
+        baselines = baseline_poly(x_data, y_data, **kwargs)
+    elif method == "rolling_ball":
+        baselines = baseline_rolling_ball(y_data, **kwargs)
+    else:
+        raise ValueError("method must be one of " + ", ".join(METHODS))
+
+    return np.asarray(y_data) - baselines, baselines
@@ -0,0 +1,307 @@
+"""
+chunked.py
+
+Out-of-core processing of FTIR interferograms. Interferograms are streamed from
+CSV files, or from a memory-mapped stack on disk, in bounded batches through the
+Fourier transform and band-integration stages, so that datasets larger than RAM
+can be processed with a fixed memory footprint.
+
+Author: Shiqi Xu
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from scipy import integrate
+
+import screening
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Reports the peak resident set size (RSS) of the current process.
+
+    Returns:
+        Optional[float]: Peak RSS in MB, or None if it cannot be determined on this
+            platform.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## ru_maxrss is in bytes on macOS, in kB elsewhere
+    if sys.platform == "darwin":
+        return max_rss / 1024**2
+    return max_rss / 1024
+
+
+def read_intensity(path_csv: Union[str, Path], dtype=np.float64) -> np.ndarray:
+    """Reads only the dependent variable column of a CSV file.
+
+    Args:
+        path_csv (Union[str, Path]): Path to CSV file containing data.
+        dtype (np.dtype, optional): Output dtype. Defaults to np.float64.
+
+    Returns:
+        np.ndarray[float]: Array containing dependent variable data.
+    """
+    data = pd.read_csv(path_csv, header=None, usecols=[1], dtype=dtype)
+    return data.iloc[:, 0].to_numpy()
+
+
+def build_memmap_stack(
+    paths_csv: Sequence[Union[str, Path]],
+    path_stack: Union[str, Path],
+    dtype=np.float64,
+) -> np.memmap:
+    """Writes interferograms into a single memory-mapped .npy stack on disk, one
+    file at a time, so that only one interferogram is held in memory while building.
+
+    Args:
+        paths_csv (Sequence[Union[str, Path]]): Paths to interferogram CSV files.
+            All interferograms must have the same number of points.
+        path_stack (Union[str, Path]): Path to output .npy file.
+        dtype (np.dtype, optional): Stored dtype. Defaults to np.float64.
+
+    Returns:
+        np.memmap: Memory-mapped array of shape (no. of interferograms, no. of points).
+    """
+    first = read_intensity(paths_csv[0], dtype=dtype)
+    stack = np.lib.format.open_memmap(
+        path_stack, mode="w+", dtype=dtype, shape=(len(paths_csv), len(first))
+    )
+    stack[0] = first
+    for i in range(1, len(paths_csv)):
+        ifg_y = read_intensity(paths_csv[i], dtype=dtype)
+        if len(ifg_y) != stack.shape[1]:
+            raise ValueError(
+                "interferogram length mismatch: "
+                + str(paths_csv[i])
+                + " has "
+                + str(len(ifg_y))
+                + " points, expected "
+                + str(stack.shape[1])
+            )
+        stack[i] = ifg_y
+    stack.flush()
+
+    return stack
+
+
+def open_memmap_stack(path_stack: Union[str, Path]) -> np.memmap:
+    """Opens a memory-mapped interferogram stack read-only.
+
+    Args:
+        path_stack (Union[str, Path]): Path to .npy file written by
+            build_memmap_stack.
+
+    Returns:
+        np.memmap: Memory-mapped array of shape (no. of interferograms, no. of points).
+    """
+    return np.load(path_stack, mmap_mode="r")
+
+
+def iter_batches(
+    source: Union[np.ndarray, Sequence[Union[str, Path]]], batch_size: int
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yields bounded batches of interferograms.
+
+    Args:
+        source (Union[np.ndarray, Sequence[Union[str, Path]]]): Either a 2-D
+            (possibly memory-mapped) array of interferograms, or a sequence of paths
+            to interferogram CSV files.
+        batch_size (int): Max. number of interferograms per batch.
+
+    Yields:
+        Tuple[int, np.ndarray[float]]: Index of the first interferogram in the batch,
+            and a 2-D array of shape (batch size, no. of points).
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    for start in range(0, len(source), batch_size):
+        if isinstance(source, np.ndarray):
+            batch = np.asarray(source[start:start + batch_size])
+        else:
+            batch = np.stack(
+                [read_intensity(path) for path in source[start:start + batch_size]]
+            )
+        yield start, batch
+
+
+def fourier_transform_batch(
+    ifg_y: np.ndarray,
+    wavenumber_res: float,
+    min_wavenumber: float = 400,
+    max_wavenumber: float = 4000,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fourier transforms a batch of interferograms into single-beam spectra,
+    cropped to the indicated spectral window. Matches the wavenumber and intensity
+    output of spectra.fourier_transform for each row, without computing the full
+    frequency axis or keeping the uncropped transform.
+
+    Args:
+        ifg_y (np.ndarray[float]): 2-D array of interferogram intensity data, one
+            interferogram per row, in units of Volts.
+        wavenumber_res (float): Wavenumber spacing, in cm^{-1}.
+        min_wavenumber (float, optional): Lower wavenumber of window. Defaults to 400.
+        max_wavenumber (float, optional): Upper wavenumber of window. Defaults to 4000.
+
+    Returns:
+        Tuple[np.ndarray[float], np.ndarray[float]]: Wavenumber array in cm^{-1},
+            shared by all rows, and 2-D array of single-beam intensity data, in
+            arbitrary units.
+    """
+    ifg_y = np.atleast_2d(ifg_y)
+    n_points = ifg_y.shape[1]
+
+    ## positive half of np.fft.fftfreq(n, 1/wavenumber_res/n)
+    freq_step = 1.0 / (n_points * (1 / wavenumber_res / n_points))
+    spectrum_x = np.arange((n_points - 1) // 2 + 1) * freq_step
+    start = np.searchsorted(spectrum_x, min_wavenumber, side="left")
+    end = start + np.searchsorted(spectrum_x[start:], max_wavenumber, side="left")
+
+    spectrum_y = np.fft.hfft(ifg_y, axis=-1)[:, start:end]
+
+    return spectrum_x[start:end], np.abs(spectrum_y)
+
+
+def band_integrals(
+    wavenumber_data: np.ndarray,
+    y_data: np.ndarray,
+    windows: Sequence[Tuple[float, float]],
+) -> np.ndarray:
+    """Integrates each row over each spectral window, normalized by window width.
+    Uses the same cropping convention as spectra.tot_transmission.
+
+    Args:
+        wavenumber_data (np.ndarray[float]): Ascending wavenumber array, in cm^{-1}.
+        y_data (np.ndarray[float]): 2-D array of spectra, one per row.
+        windows (Sequence[Tuple[float, float]]): (min, max) wavenumber windows.
+
+    Returns:
+        np.ndarray[float]: Array of shape (no. of spectra, no. of windows).
+    """
+    y_data = np.atleast_2d(y_data)
+    integrals = np.empty((y_data.shape[0], len(windows)))
+    for j, (min_wavenumber, max_wavenumber) in enumerate(windows):
+        start = np.searchsorted(wavenumber_data, min_wavenumber, side="left")
+        end = start + np.searchsorted(
+            wavenumber_data[start:], max_wavenumber, side="left"
+        )
+        integrals[:, j] = integrate.trapezoid(
+            y_data[:, start:end], wavenumber_data[start:end], axis=-1
+        ) / (max_wavenumber - min_wavenumber)
+
+    return integrals
+
+
+def process_chunked(
+    source: Union[np.ndarray, Sequence[Union[str, Path]]],
+    wavenumber_res: float,
+    windows: Sequence[Tuple[float, float]],
+    batch_size: int = 16,
+    min_wavenumber: float = 400,
+    max_wavenumber: float = 4000,
+    path_spectra: Optional[Union[str, Path]] = None,
+    screen: bool = False,
+) -> Dict[str, object]:
+    """Streams interferograms through the Fourier transform and band-integration
+    stages in bounded batches. Only one batch of interferograms and spectra is held
+    in memory at a time; spectra are optionally written to a memory-mapped .npy file.
+
+    Args:
+        source (Union[np.ndarray, Sequence[Union[str, Path]]]): Either a 2-D
+            (possibly memory-mapped) array of interferograms, or a sequence of paths
+            to interferogram CSV files.
+        wavenumber_res (float): Wavenumber spacing, in cm^{-1}.
+        windows (Sequence[Tuple[float, float]]): (min, max) wavenumber windows to
+            integrate over.
+        batch_size (int, optional): Max. number of interferograms per batch.
+            Defaults to 16.
+        min_wavenumber (float, optional): Lower wavenumber of FFT window.
+            Defaults to 400.
+        max_wavenumber (float, optional): Upper wavenumber of FFT window.
+            Defaults to 4000.
+        path_spectra (Union[str, Path], optional): Path to .npy file to store the
+            single-beam spectra in. Defaults to None (spectra are discarded).
+        screen (bool, optional): Whether to screen each batch with
+            screening.screen_interferograms first. Interferograms that fail are
+            not transformed, and get NaN integrals and spectra. Defaults to False.
+
+    Returns:
+        Dict[str, object]: Dictionary containing "wavenumbers" (np.ndarray[float]),
+            "integrals" (np.ndarray[float] of shape (no. of interferograms,
+            no. of windows)), "spectra" (np.memmap or None), "passed"
+            (np.ndarray[bool]), "screening" (pd.DataFrame or None), and
+            "peak_rss_mb" (float or None).
+    """
+    integrals = np.full((len(source), len(windows)), np.nan)
+    passed = np.ones(len(source), dtype=bool)
+    reports = []
+    wavenumbers = None
+    stored_spectra = None
+
+    for start, batch in iter_batches(source, batch_size):
+        if screen:
+            report = screening.screen_interferograms(batch)
+            report.index = report.index + start
+            reports.append(report)
+            passed[start:start + len(batch)] = report["passed"].to_numpy()
+        batch_passed = passed[start:start + len(batch)]
+        if not batch_passed.any():
+            continue
+        rows = start + np.flatnonzero(batch_passed)
+        wavenumbers, spectrum_y = fourier_transform_batch(
+            batch[batch_passed], wavenumber_res, min_wavenumber, max_wavenumber
+        )
+        integrals[rows] = band_integrals(wavenumbers, spectrum_y, windows)
+        if path_spectra is not None:
+            if stored_spectra is None:
+                stored_spectra = np.lib.format.open_memmap(
+                    path_spectra,
+                    mode="w+",
+                    dtype=spectrum_y.dtype,
+                    shape=(len(source), spectrum_y.shape[1]),
+                )
+                stored_spectra[:] = np.nan
+            stored_spectra[rows] = spectrum_y
+        del batch, spectrum_y
+
+    if stored_spectra is not None:
+        stored_spectra.flush()
+
+    return {
+        "wavenumbers": wavenumbers,
+        "integrals": integrals,
+        "spectra": stored_spectra,
+        "passed": passed,
+        "screening": pd.concat(reports) if reports else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+if __name__ == "__main__":
+
+    ifg_files: List[Path] = []
+    for date in ["2022-01-25", "2022-01-28"]:
+        data_path = Path.cwd() / "data" / date
+        for csv_file in data_path.iterdir():
+            if "_sample_ifg" in str(csv_file.name):
+                ifg_files.append(csv_file)
+    ifg_files.sort()
+
+    results = process_chunked(
+        ifg_files, 0.241, [(2200, 2500), (2280, 2390)], batch_size=4, screen=True
+    )
+    for i in range(len(ifg_files)):
+        if results["passed"][i]:
+            print(str(ifg_files[i].name)[11:-15], results["integrals"][i])
+        else:
+            print(str(ifg_files[i].name)[11:-4], "failed screening, skipped")
+    print("peak RSS (MB):", results["peak_rss_mb"])
@@ -0,0 +1,144 @@
+"""
+config.py
+
+Declarative analysis configuration (TOML), replacing constants hard-coded in the
+analysis scripts, and expansion of parameter grids into jobs (run by sweep.py).
+
+Author: Shiqi Xu
+"""
+
+import copy
+import glob
+import itertools
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+DEFAULTS = {
+    "fft": {
+        "wavenumber_res": 0.241,  # cm^{-1}
+        "min_wavenumber": 400,
+        "max_wavenumber": 4000,
+        "zero_fill": 1,
+        "apodization": "boxcar",
+        "ref_scale": 0.9,  # scale of reference spectrum in overlay plots
+    },
+    "co2": {
+        "crop_window": [2200, 2500],
+        "band_window": [2280, 2390],
+        "background": "",
+        "samples": [],
+    },
+    "water": {
+        "window": [1970, 2140],
+        "para_guess": [2090, 8.57, 6.4e-7],
+        "files": [],
+    },
+    "fft_bands": {
+        "windows": [[2200, 2500], [2280, 2390]],
+        "files": [],
+    },
+    "time_resolved": {
+        "windows": [[1400, 1900], [2280, 2390], [3550, 3900]],  # H2O, CO2, H2O
+        "n_components": 3,
+        "plot_window": [1000, 4000],
+    },
+    "filenames": {
+        "label_slice": [17, -13],
+    },
+    "cache": {
+        "dir": "",  # on-disk FFT cache; "" for memory only
+        "memory_mb": 256,
+        "disk_mb": 2048,
+    },
+    "run": {
+        "pipeline": "co2_transmission",
+        "output": "",
+    },
+    "grid": {},
+}
+
+
+def _merge(base: Dict, overrides: Dict, path: str = "") -> Dict:
+    """Recursively merges overrides into a copy of base, rejecting unknown keys."""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if key not in base:
+            raise KeyError("unknown configuration key: " + path + key)
+        if isinstance(base[key], dict) and base[key] and isinstance(value, dict):
+            merged[key] = _merge(base[key], value, path + key + ".")
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def load_config(path_toml: Union[str, Path, None] = None) -> Dict:
+    """Loads an analysis configuration, filling in defaults.
+
+    Args:
+        path_toml (Union[str, Path], optional): Path to TOML configuration file.
+            Defaults to None (defaults only).
+
+    Returns:
+        Dict: Configuration, with the same structure as DEFAULTS.
+    """
+    if path_toml is None:
+        return copy.deepcopy(DEFAULTS)
+    with open(path_toml, "rb") as toml_file:
+        overrides = tomllib.load(toml_file)
+    return _merge(DEFAULTS, overrides)
+
+
+def get_param(config: Dict, dotted_key: str):
+    """Looks up a configuration value by dotted key, e.g. "co2.band_window"."""
+    value = config
+    for key in dotted_key.split("."):
+        value = value[key]
+    return value
+
+
+def set_param(config: Dict, dotted_key: str, value):
+    """Sets a configuration value by dotted key, e.g. "co2.band_window"."""
+    keys = dotted_key.split(".")
+    get_param(config, ".".join(keys[:-1]))[keys[-1]] = value
+
+
+def expand_grid(config: Dict) -> List[Tuple[Dict, Dict]]:
+    """Expands the [grid] table of a configuration into one job per grid point.
+    Each [grid] entry maps a dotted key to a list of values; the jobs are the
+    Cartesian product of all lists.
+
+    Args:
+        config (Dict): Configuration from load_config.
+
+    Returns:
+        List[Tuple[Dict, Dict]]: (grid point, job configuration) for each job. The
+            grid point maps each dotted key to its value for that job.
+    """
+    grid = config["grid"]
+    for dotted_key in grid:
+        get_param(config, dotted_key)  # raises KeyError for unknown keys
+    keys = list(grid)
+    jobs = []
+    for values in itertools.product(*[grid[key] for key in keys]):
+        job_config = copy.deepcopy(config)
+        job_config["grid"] = {}
+        point = dict(zip(keys, values))
+        for dotted_key, value in point.items():
+            set_param(job_config, dotted_key, value)
+        jobs.append((point, job_config))
+    return jobs
+
+
+def expand_paths(patterns: Union[str, List[str]]) -> List[Path]:
+    """Expands glob patterns (relative to the working directory) into sorted paths."""
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    paths = set()
+    for pattern in patterns:
+        paths.update(Path(path) for path in glob.glob(pattern))
+    return sorted(paths)
@@ -0,0 +1,276 @@
+"""
+fftcache.py
+
+Content-addressed cache of Fourier transform outputs. Single-beam spectra are
+keyed by a hash of the interferogram data plus the processing parameters
+(resolution, zero-fill, apodization and band limits), and kept in an in-memory
+LRU tier and an optional on-disk tier, both with size-based eviction, so repeated
+passes over the same interferograms skip the transform entirely.
+
+Author: Shiqi Xu
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+import chunked
+import screening
+
+APODIZATIONS = {
+    "boxcar": np.ones,
+    "triangular": np.bartlett,
+    "happ-genzel": np.hamming,
+    "blackman": np.blackman,
+}
+
+
+def apodize(ifg_y: np.ndarray, apodization: str = "boxcar") -> np.ndarray:
+    """Applies an apodization window across the acquired (non-zero-filled) region
+    of each interferogram.
+
+    Args:
+        ifg_y (np.ndarray[float]): 2-D array of interferograms, one per row.
+        apodization (str, optional): One of APODIZATIONS. Defaults to "boxcar".
+
+    Returns:
+        np.ndarray[float]: Apodized interferograms, same shape as ifg_y.
+    """
+    if apodization not in APODIZATIONS:
+        raise ValueError("apodization must be one of " + ", ".join(APODIZATIONS))
+    if apodization == "boxcar":
+        return ifg_y
+    apodized = np.zeros_like(ifg_y)
+    for i, n_acquired in enumerate(screening.acquired_length(ifg_y)):
+        apodized[i, :n_acquired] = ifg_y[i, :n_acquired] * APODIZATIONS[apodization](
+            n_acquired
+        )
+    return apodized
+
+
+def transform(
+    ifg_y: np.ndarray,
+    wavenumber_res: float,
+    zero_fill: int = 1,
+    apodization: str = "boxcar",
+    min_wavenumber: float = 400,
+    max_wavenumber: float = 4000,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Apodizes, zero-fills and Fourier transforms a stack of interferograms. With
+    the defaults, this is the same as chunked.fourier_transform_batch.
+
+    Args:
+        ifg_y (np.ndarray[float]): Interferogram, or 2-D array of interferograms
+            (one per row), in units of Volts.
+        wavenumber_res (float): Wavenumber spacing without zero-fill, in cm^{-1}.
+        zero_fill (int, optional): Zero-filling factor. Defaults to 1 (none).
+        apodization (str, optional): One of APODIZATIONS. Defaults to "boxcar".
+        min_wavenumber (float, optional): Lower wavenumber of window. Defaults to 400.
+        max_wavenumber (float, optional): Upper wavenumber of window. Defaults to 4000.
+
+    Returns:
+        Tuple[np.ndarray[float], np.ndarray[float]]: Wavenumber array in cm^{-1},
+            and 2-D array of single-beam intensity data, in arbitrary units.
+    """
+    ifg_y = apodize(np.atleast_2d(np.asarray(ifg_y, dtype=np.float64)), apodization)
+    if zero_fill > 1:
+        n_points = ifg_y.shape[1]
+        ifg_y = np.pad(ifg_y, ((0, 0), (0, (zero_fill - 1) * n_points)))
+    return chunked.fourier_transform_batch(
+        ifg_y, wavenumber_res / zero_fill, min_wavenumber, max_wavenumber
+    )
+
+
+def cache_key(ifg_y: np.ndarray, **params) -> str:
+    """Hashes an interferogram and its processing parameters.
+
+    Args:
+        ifg_y (np.ndarray[float]): Interferogram intensity data (1-D).
+        **params: Processing parameters, e.g. wavenumber_res and zero_fill.
+
+    Returns:
+        str: Hex digest identifying the transform output.
+    """
+    ifg_y = np.ascontiguousarray(ifg_y, dtype=np.float64)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(ifg_y.shape).encode())
+    digest.update(ifg_y.tobytes())
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+def _freeze(value: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Marks cached arrays read-only, so a caller writing to a returned array
+    cannot change later hits."""
+    for array in value:
+        array.setflags(write=False)
+    return value
+
+
+class FFTCache:
+    """Two-tier (memory LRU, then disk) cache of single-beam spectra. Cached
+    arrays are read-only; copy them before modifying.
+
+    Args:
+        max_memory_mb (float, optional): Size limit of the in-memory tier, in MB.
+            Defaults to 256.
+        cache_dir (Union[str, Path], optional): Directory of the on-disk tier.
+            Defaults to None (memory only).
+        max_disk_mb (float, optional): Size limit of the on-disk tier, in MB.
+            Least recently used files are deleted first. Defaults to 2048.
+    """
+
+    def __init__(
+        self,
+        max_memory_mb: float = 256,
+        cache_dir: Union[str, Path] = None,
+        max_disk_mb: float = 2048,
+    ):
+        self.max_memory_bytes = int(max_memory_mb * 1024**2)
+        self.max_disk_bytes = int(max_disk_mb * 1024**2)
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    def _put_memory(self, key: str, value: Tuple[np.ndarray, np.ndarray]):
+        size = value[0].nbytes + value[1].nbytes
+        if size > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            return
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (old_x, old_y) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_x.nbytes + old_y.nbytes
+            self.stats["memory_evictions"] += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / (key + ".npz")
+
+    def _put_disk(self, key: str, value: Tuple[np.ndarray, np.ndarray]):
+        path = self._disk_path(key)
+        path_tmp = path.with_suffix(".tmp.npz")
+        np.savez(path_tmp, x=value[0], y=value[1])
+        os.replace(path_tmp, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = [(path, path.stat()) for path in self.cache_dir.glob("*.npz")]
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.max_disk_bytes:
+                break
+            path.unlink()
+            total -= stat.st_size
+            self.stats["disk_evictions"] += 1
+
+    def get(self, key: str):
+        """Looks up a transform output by key.
+
+        Args:
+            key (str): Key from cache_key.
+
+        Returns:
+            Optional[Tuple[np.ndarray[float], np.ndarray[float]]]: Wavenumber and
+                single-beam intensity arrays, or None on a miss.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return self._memory[key]
+        if self.cache_dir is not None and self._disk_path(key).exists():
+            path = self._disk_path(key)
+            with np.load(path) as stored:
+                value = _freeze((stored["x"], stored["y"]))
+            os.utime(path)  # mark as recently used
+            self.stats["disk_hits"] += 1
+            self._put_memory(key, value)
+            return value
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: Tuple[np.ndarray, np.ndarray]):
+        """Stores a transform output in both tiers. The arrays are marked
+        read-only, and should not be shared with other entries.
+
+        Args:
+            key (str): Key from cache_key.
+            value (Tuple[np.ndarray[float], np.ndarray[float]]): Wavenumber and
+                single-beam intensity arrays.
+        """
+        self._put_memory(key, _freeze(value))
+        if self.cache_dir is not None:
+            self._put_disk(key, value)
+
+    def transform(
+        self,
+        ifg_y: np.ndarray,
+        wavenumber_res: float,
+        zero_fill: int = 1,
+        apodization: str = "boxcar",
+        min_wavenumber: float = 400,
+        max_wavenumber: float = 4000,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached version of transform. Only interferograms not already in the
+        cache are transformed, together in one batch.
+
+        Args:
+            ifg_y (np.ndarray[float]): Interferogram, or 2-D array of interferograms
+                (one per row), in units of Volts.
+            wavenumber_res (float): Wavenumber spacing without zero-fill, in cm^{-1}.
+            zero_fill (int, optional): Zero-filling factor. Defaults to 1.
+            apodization (str, optional): One of APODIZATIONS. Defaults to "boxcar".
+            min_wavenumber (float, optional): Lower wavenumber of window.
+                Defaults to 400.
+            max_wavenumber (float, optional): Upper wavenumber of window.
+                Defaults to 4000.
+
+        Returns:
+            Tuple[np.ndarray[float], np.ndarray[float]]: Wavenumber array in
+                cm^{-1} (read-only), and 2-D array of single-beam intensity data.
+        """
+        params = {
+            "wavenumber_res": float(wavenumber_res),
+            "zero_fill": int(zero_fill),
+            "apodization": apodization,
+            "min_wavenumber": float(min_wavenumber),
+            "max_wavenumber": float(max_wavenumber),
+        }
+        ifg_y = np.atleast_2d(ifg_y)
+        keys = [cache_key(row, **params) for row in ifg_y]
+        found = [self.get(key) for key in keys]
+        missing = [i for i in range(len(keys)) if found[i] is None]
+        if missing:
+            spectrum_x, spectrum_y = transform(ifg_y[missing], **params)
+            for j, i in enumerate(missing):
+                ## one wavenumber array per entry, so that each entry's size in
+                ## the memory tier is counted in full
+                found[i] = (spectrum_x.copy(), spectrum_y[j].copy())
+                self.put(keys[i], found[i])
+
+        return found[0][0], np.stack([value[1] for value in found])
+
+    def info(self) -> Dict[str, int]:
+        """Returns hit/miss/eviction counters and current tier sizes."""
+        info = dict(self.stats)
+        info["memory_entries"] = len(self._memory)
+        info["memory_bytes"] = self._memory_bytes
+        if self.cache_dir is not None:
+            info["disk_bytes"] = sum(
+                path.stat().st_size for path in self.cache_dir.glob("*.npz")
+            )
+        return info
@@ -4,12 +4,24 @@ fourier.py
 Fourier transforms and inverse Fourier transforms of FTIR interferograms/spectra.
 """
 
+import sys
 from pathlib import Path
 
+import config
+import fftcache
 import spectra
 
 if __name__ == "__main__":
 
+    analysis_config = config.load_config(sys.argv[1] if len(sys.argv) > 1 else None)
+    fft_config = analysis_config["fft"]
+    cache_config = analysis_config["cache"]
+    fft_cache = fftcache.FFTCache(
+        max_memory_mb=cache_config["memory_mb"],
+        cache_dir=cache_config["dir"] or None,
+        max_disk_mb=cache_config["disk_mb"],
+    )
+
     sample_ifgs_220125 = [
         "2022-01-25_run00_2.0res_evac_-93kPa_sample_ifg.CSV",
         "2022-01-25_run01_2.0res_air_-80kPa_sample_ifg_wavy.CSV",
@@ -44,13 +56,21 @@ if __name__ == "__main__":
         ref_x, ref_y = spectra.read_data(ref_spectra_files[i])
         data_points, voltage = spectra.read_data(ifg_path)
         fig_name = "_".join(sample_ifgs_220125[i].split("_")[:5]) + "_fft_spectrum.png"
-        wavenumbers, intensity = spectra.fourier_transform(
-            data_points,
+        wavenumbers, intensity = fft_cache.transform(
             voltage,
-            0.241,
+            fft_config["wavenumber_res"],
+            zero_fill = fft_config["zero_fill"],
+            apodization = fft_config["apodization"],
+            min_wavenumber = fft_config["min_wavenumber"],
+            max_wavenumber = fft_config["max_wavenumber"],
+        )
+        spectra.plot_fourier_spectrum(
+            wavenumbers,
+            intensity[0],
             ref_spectrum_x = ref_x,
-            ref_spectrum_y = 0.9 * ref_y,
-            plot = True,
+            ref_spectrum_y = fft_config["ref_scale"] * ref_y,
             save_fig = True,
             path_save = output_path / fig_name,
         )
+
+    print("FFT cache:", fft_cache.info())
@@ -0,0 +1,225 @@
+"""
+peaks.py
+
+Vectorized peak picking for FTIR spectra: detects absorption features across a
+stack of spectra, measures their centre, FWHM, area and prominence, and assigns
+them to known molecular bands via an interval index over the reference table.
+
+Author: Shiqi Xu
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import integrate, signal
+
+## reference band table: (centre in cm^{-1}, half-width of match window in cm^{-1},
+## species, band); kept sorted by centre
+REFERENCE_BANDS = sorted(
+    [
+        (667.0, 40.0, "CO2", "nu2 bend"),
+        (1306.0, 30.0, "CH4", "nu4 bend"),
+        (1595.0, 300.0, "H2O", "nu2 bend"),
+        (2143.0, 60.0, "CO", "fundamental"),
+        (2224.0, 25.0, "N2O", "nu3 stretch"),
+        (2349.0, 60.0, "CO2", "nu3 asym. stretch"),
+        (3019.0, 100.0, "CH4", "nu3 stretch"),
+        (3612.0, 20.0, "CO2", "nu1+nu3 combination"),
+        (3715.0, 20.0, "CO2", "2nu2+nu3 combination"),
+        (3756.0, 200.0, "H2O", "nu1/nu3 stretch"),
+    ]
+)
+
+
+def _build_index(reference_bands):
+    """Builds an interval index over the match windows of a sorted reference band
+    table: band centres, the order of the windows by lower bound, their sorted
+    lower and upper bounds, and the running maximum of the upper bounds."""
+    centres = np.array([band[0] for band in reference_bands], dtype=np.float64)
+    half_widths = np.array([band[1] for band in reference_bands], dtype=np.float64)
+    if np.any(np.diff(centres) < 0):
+        raise ValueError("reference band table must be sorted by centre")
+    by_lower = np.argsort(centres - half_widths, kind="stable")
+    lower = (centres - half_widths)[by_lower]
+    upper = (centres + half_widths)[by_lower]
+    reach = np.maximum.accumulate(upper) if len(upper) > 0 else upper
+    return centres, by_lower, lower, upper, reach
+
+
+def assign_bands(centres: np.ndarray, reference_bands=REFERENCE_BANDS) -> np.ndarray:
+    """Assigns each feature to the nearest reference band whose match window
+    contains it. Windows may overlap (e.g. narrow CO2 combination bands inside
+    the wide H2O stretch band). With the windows sorted by lower bound, a binary
+    search finds the last window opening at or below each feature, and a second
+    one, over the running maximum of the upper bounds, the first window that can
+    still reach it; only the windows between the two are checked.
+
+    Args:
+        centres (np.ndarray[float]): Feature centres, in cm^{-1}.
+        reference_bands (List[Tuple[float, float, str, str]], optional): Sorted
+            reference band table. Defaults to REFERENCE_BANDS.
+
+    Returns:
+        np.ndarray[int]: Index into reference_bands for each feature, or -1 if
+            unassigned.
+    """
+    band_centres, by_lower, lower, upper, reach = _build_index(reference_bands)
+    centres = np.asarray(centres, dtype=np.float64)
+    assigned = np.full(len(centres), -1)
+
+    ## windows [first, stop) in lower-bound order may contain each feature
+    stop = np.searchsorted(lower, centres, side="right")
+    first = np.minimum(np.searchsorted(reach, centres, side="left"), stop)
+    counts = stop - first
+    feature = np.repeat(np.arange(len(centres)), counts)
+    window = first[feature] + np.arange(len(feature)) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    inside = upper[window] >= centres[feature]
+    feature, window = feature[inside], window[inside]
+
+    ## closest containing window per feature (ties go to the lower bound first)
+    distance = np.abs(centres[feature] - band_centres[by_lower[window]])
+    order = np.lexsort((distance, feature))
+    feature, window = feature[order], window[order]
+    closest = np.ones(len(feature), dtype=bool)
+    closest[1:] = feature[1:] != feature[:-1]
+    assigned[feature[closest]] = by_lower[window[closest]]
+
+    return assigned
+
+
+def find_features(
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+    prominence: float = None,
+    width: float = None,
+    direction: str = "down",
+    reference_bands=REFERENCE_BANDS,
+) -> pd.DataFrame:
+    """Detects, measures and labels features across a stack of spectra.
+
+    Args:
+        x_data (np.ndarray[float]): Ascending, evenly spaced wavenumber data, shared
+            by all spectra.
+        y_data (np.ndarray[float]): Spectrum, or 2-D array of spectra (one per row).
+        prominence (float, optional): Min. prominence of a feature, in units of
+            y_data. Defaults to None (no filtering).
+        width (float, optional): Min. FWHM of a feature, in cm^{-1}. Defaults to
+            None (no filtering).
+        direction (str, optional): "down" if features are absorption dips (e.g.
+            single-beam or % transmission spectra), "up" if they are peaks.
+            Defaults to "down".
+        reference_bands (List[Tuple[float, float, str, str]], optional): Sorted
+            reference band table. Defaults to REFERENCE_BANDS.
+
+    Returns:
+        pd.DataFrame: One row per feature, with columns "spectrum" (row index into
+            y_data), "centre", "height", "prominence", "fwhm", "area" (between the
+            feature and the level of its higher base, positive for both
+            directions), "species"
+            and "band" (None if unassigned).
+    """
+    if direction not in ("up", "down"):
+        raise ValueError("direction must be 'up' or 'down'")
+    x_data = np.asarray(x_data, dtype=np.float64)
+    y_stack = np.atleast_2d(np.asarray(y_data, dtype=np.float64))
+    y_oriented = -y_stack if direction == "down" else y_stack
+    x_step = (x_data[-1] - x_data[0]) / (len(x_data) - 1)
+    point_index = np.arange(len(x_data))
+    min_width = None if width is None else width / x_step
+
+    ## cumulative integral of each spectrum, for areas between arbitrary bounds
+    cumulative = integrate.cumulative_trapezoid(
+        y_oriented, x_data, axis=-1, initial=0
+    )
+
+    columns = {
+        key: []
+        for key in ("spectrum", "centre", "height", "prominence", "fwhm", "area")
+    }
+    for i, y_row in enumerate(y_oriented):
+        peak_idx, properties = signal.find_peaks(
+            y_row, prominence=prominence if prominence is not None else 0
+        )
+        fwhm, _, left_ips, right_ips = signal.peak_widths(
+            y_row,
+            peak_idx,
+            rel_height=0.5,
+            prominence_data=(
+                properties["prominences"],
+                properties["left_bases"],
+                properties["right_bases"],
+            ),
+        )
+        ## full width at the higher of the two bases, for the feature area
+        _, base_level, left_base_ips, right_base_ips = signal.peak_widths(
+            y_row,
+            peak_idx,
+            rel_height=1.0,
+            prominence_data=(
+                properties["prominences"],
+                properties["left_bases"],
+                properties["right_bases"],
+            ),
+        )
+        if min_width is not None:
+            keep = fwhm >= min_width
+            peak_idx, left_ips, right_ips = (
+                peak_idx[keep],
+                left_ips[keep],
+                right_ips[keep],
+            )
+            base_level = base_level[keep]
+            left_base_ips, right_base_ips = left_base_ips[keep], right_base_ips[keep]
+            properties = {key: value[keep] for key, value in properties.items()}
+
+        ## area between each feature and the level of its higher base
+        x_left = np.interp(left_base_ips, point_index, x_data)
+        x_right = np.interp(right_base_ips, point_index, x_data)
+        area = (
+            np.interp(right_base_ips, point_index, cumulative[i])
+            - np.interp(left_base_ips, point_index, cumulative[i])
+            - base_level * (x_right - x_left)
+        )
+
+        columns["spectrum"].append(np.full(len(peak_idx), i))
+        columns["centre"].append(x_data[peak_idx])
+        columns["height"].append(y_stack[i, peak_idx])
+        columns["prominence"].append(properties["prominences"])
+        columns["fwhm"].append(
+            np.interp(right_ips, point_index, x_data)
+            - np.interp(left_ips, point_index, x_data)
+        )
+        columns["area"].append(area)
+
+    features = pd.DataFrame(
+        {key: np.concatenate(value) for key, value in columns.items()}
+    )
+    assigned = assign_bands(features["centre"].to_numpy(), reference_bands)
+    species = np.array([band[2] for band in reference_bands] + [None], dtype=object)
+    bands = np.array([band[3] for band in reference_bands] + [None], dtype=object)
+    features["species"] = species[assigned]
+    features["band"] = bands[assigned]
+
+    return features
+
+
+def feature_inventory(features: pd.DataFrame) -> pd.DataFrame:
+    """Summarizes assigned features per spectrum and band.
+
+    Args:
+        features (pd.DataFrame): Output of find_features.
+
+    Returns:
+        pd.DataFrame: Number of features, total area and max. prominence, indexed
+            by spectrum, species and band.
+    """
+    return (
+        features.dropna(subset=["species"])
+        .groupby(["spectrum", "species", "band"])
+        .agg(
+            n_features=("centre", "size"),
+            total_area=("area", "sum"),
+            max_prominence=("prominence", "max"),
+        )
+    )
@@ -0,0 +1,448 @@
+"""
+regression.py
+
+Golden-output regression harness. The existing implementations of
+spectra.background_ratio, spectra.tot_transmission, spectra.fourier_transform and
+water.absorption are run on the real data files, and their outputs are recorded
+as reference arrays, with tolerances, under references/. Faster code paths
+(candidates) are then diffed against the references in parallel, with the
+reference and candidate timed side by side, so performance work can be checked
+against today's numerics.
+
+The references under references/ are committed with the code; re-record them
+only when a change to the numerics is intended.
+
+Usage:
+    python src/regression.py compare [no. of workers]
+    python src/regression.py record
+
+Author: Shiqi Xu
+"""
+
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import scipy
+
+import chunked
+import config
+import fftcache
+import spectra
+import uncertainty
+import water
+
+## relative and absolute tolerances, per case and output
+TOLERANCES = {
+    "background_ratio": {
+        "wavenumbers": {"rtol": 0, "atol": 1e-9},
+        "transmission": {"rtol": 1e-12, "atol": 1e-9},
+    },
+    "tot_transmission": {
+        "total_transmission": {"rtol": 1e-9, "atol": 1e-9},
+    },
+    "fourier_transform": {
+        "wavenumbers": {"rtol": 0, "atol": 1e-9},
+        "intensity": {"rtol": 1e-7, "atol": 1e-9},
+    },
+    "water_absorption": {
+        "absorption": {"rtol": 1e-4, "atol": 1e-6},  # % absorption
+    },
+}
+
+
+## inputs: each loader returns the data files used and the prepared inputs
+
+
+def _load_ratio_inputs(data_dir: Path, analysis_config: Dict) -> Dict:
+    bkgd = data_dir / "2022-01-25" / "2022-01-25_run00_2.0res_evac_-93kPa_spectrum.CSV"
+    samples = sorted((data_dir / "2022-01-25").glob("*_air_*_spectrum*.CSV"))
+    return {"files": [bkgd] + samples, "bkgd": bkgd, "samples": samples}
+
+
+def _load_transmission_inputs(data_dir: Path, analysis_config: Dict) -> Dict:
+    inputs = _load_ratio_inputs(data_dir, analysis_config)
+    crop_min, crop_max = analysis_config["co2"]["crop_window"]
+    x_cropped, y_cropped = [], []
+    for sample in inputs["samples"]:
+        wavenumbers, transmission = spectra.background_ratio(inputs["bkgd"], sample)
+        x_sample, y_sample = water.crop_spectrum(
+            crop_min, crop_max, wavenumbers, transmission
+        )
+        x_cropped.append(np.asarray(x_sample))
+        y_cropped.append(np.asarray(y_sample))
+    inputs.update(
+        {
+            "x_cropped": x_cropped,
+            "y_cropped": y_cropped,
+            "band_window": analysis_config["co2"]["band_window"],
+        }
+    )
+    return inputs
+
+
+def _load_ifg_inputs(data_dir: Path, analysis_config: Dict) -> Dict:
+    files = sorted((data_dir / "2022-01-25").glob("*_sample_ifg*.CSV"))
+    ifgs = [spectra.read_data(path) for path in files]
+    return {
+        "files": files,
+        "ifg_x": [ifg[0] for ifg in ifgs],
+        "ifg_y": [ifg[1] for ifg in ifgs],
+        "fft": analysis_config["fft"],
+    }
+
+
+def _load_water_inputs(data_dir: Path, analysis_config: Dict) -> Dict:
+    files = sorted((data_dir / "2022-02-15").glob("2022-02-15_run02_*.CSV"))
+    window_min, window_max = analysis_config["water"]["window"]
+    x_tops, y_tops, fitted_params = [], [], []
+    for path in files:
+        x_data, y_data = spectra.read_data(path)
+        x_cropped, y_cropped = water.crop_spectrum(
+            window_min, window_max, x_data, y_data
+        )
+        x_top, y_top = water.take_peaks(x_cropped, y_cropped)
+        bkgd_params, _ = water.fit_bkgd(
+            x_top, y_top, water.parabola, analysis_config["water"]["para_guess"]
+        )
+        x_tops.append(np.array(x_top))
+        y_tops.append(np.array(y_top))
+        fitted_params.append(bkgd_params)
+    return {
+        "files": files,
+        "x_top": x_tops,
+        "y_top": y_tops,
+        "fitted_params": fitted_params,
+    }
+
+
+## reference implementations (current numerics)
+
+
+def _ratio_reference(inputs: Dict) -> Dict[str, np.ndarray]:
+    ratios = [
+        spectra.background_ratio(inputs["bkgd"], sample) for sample in inputs["samples"]
+    ]
+    return {
+        "wavenumbers": np.stack([ratio[0] for ratio in ratios]),
+        "transmission": np.stack([ratio[1] for ratio in ratios]),
+    }
+
+
+def _transmission_reference(inputs: Dict) -> Dict[str, np.ndarray]:
+    band_min, band_max = inputs["band_window"]
+    totals = [
+        spectra.tot_transmission(x_cropped, y_cropped, band_min, band_max)
+        for x_cropped, y_cropped in zip(inputs["x_cropped"], inputs["y_cropped"])
+    ]
+    return {"total_transmission": np.array(totals)}
+
+
+def _fourier_reference(inputs: Dict) -> Dict[str, np.ndarray]:
+    fft_config = inputs["fft"]
+    spectra_fft = [
+        spectra.fourier_transform(
+            ifg_x,
+            ifg_y,
+            fft_config["wavenumber_res"],
+            min_wavenumber=fft_config["min_wavenumber"],
+            max_wavenumber=fft_config["max_wavenumber"],
+        )
+        for ifg_x, ifg_y in zip(inputs["ifg_x"], inputs["ifg_y"])
+    ]
+    return {
+        "wavenumbers": spectra_fft[0][0],
+        "intensity": np.stack([spectrum[1] for spectrum in spectra_fft]),
+    }
+
+
+def _water_reference(inputs: Dict) -> Dict[str, np.ndarray]:
+    absorp = [
+        water.absorption(x_top, y_top, params)
+        for x_top, y_top, params in zip(
+            inputs["x_top"], inputs["y_top"], inputs["fitted_params"]
+        )
+    ]
+    return {"absorption": np.array(absorp)}
+
+
+CASES = {
+    "background_ratio": (_load_ratio_inputs, _ratio_reference),
+    "tot_transmission": (_load_transmission_inputs, _transmission_reference),
+    "fourier_transform": (_load_ifg_inputs, _fourier_reference),
+    "water_absorption": (_load_water_inputs, _water_reference),
+}
+
+
+## candidate (faster) implementations, registered per case
+
+
+def _ratio_intersect(inputs: Dict) -> Dict[str, np.ndarray]:
+    """Reads the background once, and matches each sample's wavenumbers to it with
+    np.intersect1d (the inner join of spectra.background_ratio, without pandas)."""
+    bkgd_x, bkgd_y = spectra.read_data(inputs["bkgd"])
+    list_wavenumbers, list_transmission = [], []
+    for sample in inputs["samples"]:
+        sample_x, sample_y = spectra.read_data(sample)
+        wavenumbers, i_bkgd, i_sample = np.intersect1d(
+            bkgd_x, sample_x, assume_unique=True, return_indices=True
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            list_transmission.append(sample_y[i_sample] / bkgd_y[i_bkgd] * 100)
+        list_wavenumbers.append(wavenumbers)
+    return {
+        "wavenumbers": np.stack(list_wavenumbers),
+        "transmission": np.stack(list_transmission),
+    }
+
+
+def _transmission_band_integrals(inputs: Dict) -> Dict[str, np.ndarray]:
+    integrals = chunked.band_integrals(
+        inputs["x_cropped"][0],
+        np.stack(inputs["y_cropped"]),
+        [tuple(inputs["band_window"])],
+    )
+    return {"total_transmission": integrals[:, 0]}
+
+
+def _transmission_bootstrap(inputs: Dict) -> Dict[str, np.ndarray]:
+    band_min, band_max = inputs["band_window"]
+    totals = [
+        uncertainty.bootstrap_transmission(
+            x_cropped, y_cropped, band_min, band_max, n_boot=2
+        )["estimate"]
+        for x_cropped, y_cropped in zip(inputs["x_cropped"], inputs["y_cropped"])
+    ]
+    return {"total_transmission": np.array(totals)}
+
+
+def _fourier_batch(inputs: Dict) -> Dict[str, np.ndarray]:
+    fft_config = inputs["fft"]
+    wavenumbers, intensity = chunked.fourier_transform_batch(
+        np.stack(inputs["ifg_y"]),
+        fft_config["wavenumber_res"],
+        fft_config["min_wavenumber"],
+        fft_config["max_wavenumber"],
+    )
+    return {"wavenumbers": wavenumbers, "intensity": intensity}
+
+
+def _fourier_cached(inputs: Dict) -> Dict[str, np.ndarray]:
+    """Cold fftcache.FFTCache, so the transform itself is timed."""
+    fft_config = inputs["fft"]
+    wavenumbers, intensity = fftcache.FFTCache().transform(
+        np.stack(inputs["ifg_y"]),
+        fft_config["wavenumber_res"],
+        min_wavenumber=fft_config["min_wavenumber"],
+        max_wavenumber=fft_config["max_wavenumber"],
+    )
+    return {"wavenumbers": wavenumbers, "intensity": intensity}
+
+
+def _water_linear_fit(inputs: Dict) -> Dict[str, np.ndarray]:
+    """Linear least-squares parabola and vectorized integral from uncertainty.py."""
+    absorp = [
+        uncertainty.bootstrap_water_absorption(x_top, y_top, n_boot=2)["estimate"]
+        for x_top, y_top in zip(inputs["x_top"], inputs["y_top"])
+    ]
+    return {"absorption": np.array(absorp)}
+
+
+CANDIDATES: Dict[str, Dict[str, Callable]] = {
+    "background_ratio": {"numpy.intersect1d": _ratio_intersect},
+    "tot_transmission": {
+        "chunked.band_integrals": _transmission_band_integrals,
+        "uncertainty.bootstrap_transmission": _transmission_bootstrap,
+    },
+    "fourier_transform": {
+        "chunked.fourier_transform_batch": _fourier_batch,
+        "fftcache.FFTCache": _fourier_cached,
+    },
+    "water_absorption": {"uncertainty.bootstrap_water_absorption": _water_linear_fit},
+}
+
+
+def _time_call(func: Callable, inputs: Dict, repeats: int) -> Tuple[Dict, float]:
+    """Best-of-repeats wall time of func(inputs), and its outputs."""
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        outputs = func(inputs)
+        best = min(best, time.perf_counter() - start)
+    return outputs, best
+
+
+def record_references(
+    path_dir: Union[str, Path],
+    data_dir: Union[str, Path],
+    analysis_config: Dict = None,
+    cases: Sequence[str] = None,
+) -> Dict:
+    """Runs the current implementations on the data files and records their
+    outputs (one .npz per case) and a manifest of inputs, tolerances, timings
+    and library versions.
+
+    Args:
+        path_dir (Union[str, Path]): Directory to write references to.
+        data_dir (Union[str, Path]): Data directory (containing dated folders).
+        analysis_config (Dict, optional): Configuration from config.load_config.
+            Defaults to None (defaults).
+        cases (Sequence[str], optional): Cases to record. Defaults to None (all).
+
+    Returns:
+        Dict: Manifest, as written to manifest.json.
+    """
+    path_dir, data_dir = Path(path_dir), Path(data_dir)
+    path_dir.mkdir(parents=True, exist_ok=True)
+    if analysis_config is None:
+        analysis_config = config.load_config()
+    path_manifest = path_dir / "manifest.json"
+    manifest = {}
+    if path_manifest.exists():
+        with open(path_manifest) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    for case in CASES if cases is None else cases:
+        load, reference = CASES[case]
+        inputs = load(data_dir, analysis_config)
+        outputs, seconds = _time_call(reference, inputs, 1)
+        np.savez_compressed(path_dir / (case + ".npz"), **outputs)
+        manifest[case] = {
+            "files": [Path(path).name for path in inputs["files"]],
+            "tolerances": TOLERANCES[case],
+            "reference_time_s": seconds,
+            "versions": {
+                "numpy": np.__version__,
+                "scipy": scipy.__version__,
+                "pandas": pd.__version__,
+            },
+        }
+
+    with open(path_manifest, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    return manifest
+
+
+def _compare_job(args) -> List[Dict]:
+    """Diffs one candidate against the stored references, timing the reference
+    and candidate in the same process."""
+    case, candidate, path_dir, data_dir, analysis_config, repeats = args
+    with open(path_dir / "manifest.json") as manifest_file:
+        case_manifest = json.load(manifest_file)[case]
+    load, reference = CASES[case]
+    inputs = load(data_dir, analysis_config)
+    if [Path(path).name for path in inputs["files"]] != case_manifest["files"]:
+        raise ValueError("input files of " + case + " changed since recording")
+
+    _, reference_time = _time_call(reference, inputs, repeats)
+    outputs, candidate_time = _time_call(CANDIDATES[case][candidate], inputs, repeats)
+
+    rows = []
+    with np.load(path_dir / (case + ".npz")) as stored:
+        for name, tolerance in case_manifest["tolerances"].items():
+            expected = stored[name]
+            actual = np.asarray(outputs[name])
+            row = {"case": case, "candidate": candidate, "output": name}
+            if actual.shape != expected.shape:
+                row.update({"max_abs_err": np.inf, "max_rel_err": np.inf})
+                row["passed"] = False
+            else:
+                ## matching infinities (e.g. from zero background) and NaNs agree
+                same = (actual == expected) | (np.isnan(actual) & np.isnan(expected))
+                with np.errstate(invalid="ignore"):
+                    abs_err = np.where(same, 0.0, np.abs(actual - expected))
+                row["max_abs_err"] = float(np.max(abs_err, initial=0.0))
+                row["max_rel_err"] = float(
+                    np.max(
+                        abs_err / np.maximum(np.abs(expected), np.finfo(float).tiny),
+                        initial=0.0,
+                    )
+                )
+                row["passed"] = bool(
+                    np.allclose(actual, expected, equal_nan=True, **tolerance)
+                )
+            row.update(
+                {
+                    "reference_time_s": reference_time,
+                    "candidate_time_s": candidate_time,
+                    "speedup": reference_time / candidate_time,
+                }
+            )
+            rows.append(row)
+    return rows
+
+
+def compare_candidates(
+    path_dir: Union[str, Path],
+    data_dir: Union[str, Path],
+    analysis_config: Dict = None,
+    n_workers: int = None,
+    repeats: int = 3,
+) -> pd.DataFrame:
+    """Diffs every registered candidate against the recorded references.
+
+    Args:
+        path_dir (Union[str, Path]): Directory of recorded references.
+        data_dir (Union[str, Path]): Data directory (containing dated folders).
+        analysis_config (Dict, optional): Configuration from config.load_config.
+            Defaults to None (defaults).
+        n_workers (int, optional): Number of worker processes, one candidate per
+            job. Defaults to None (run in this process).
+        repeats (int, optional): Timing repeats (best is kept). Defaults to 3.
+
+    Returns:
+        pd.DataFrame: One row per (case, candidate, output), with the maximum
+            absolute and relative errors, "passed", and reference and candidate
+            times in s.
+    """
+    path_dir, data_dir = Path(path_dir), Path(data_dir)
+    if not (path_dir / "manifest.json").exists():
+        raise FileNotFoundError(
+            "no references in "
+            + str(path_dir)
+            + "; run 'python src/regression.py record' first"
+        )
+    if analysis_config is None:
+        analysis_config = config.load_config()
+    jobs = [
+        (case, candidate, path_dir, data_dir, analysis_config, repeats)
+        for case in CANDIDATES
+        for candidate in CANDIDATES[case]
+    ]
+    if n_workers is not None and n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            job_rows = list(executor.map(_compare_job, jobs))
+    else:
+        job_rows = [_compare_job(job) for job in jobs]
+
+    return pd.DataFrame([row for rows in job_rows for row in rows])
+
+
+if __name__ == "__main__":
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else "compare"
+    references_path = Path.cwd() / "references"
+    data_path = Path.cwd() / "data"
+
+    if mode == "record":
+        manifest = record_references(references_path, data_path)
+        for case, case_manifest in manifest.items():
+            print(case, len(case_manifest["files"]), "files")
+    elif mode == "compare":
+        workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        try:
+            report = compare_candidates(references_path, data_path, n_workers=workers)
+        except FileNotFoundError as error:
+            sys.exit(str(error))
+        pd.set_option("display.width", 200)
+        pd.set_option("display.max_columns", None)
+        print(report)
+        if not report["passed"].all():
+            sys.exit(1)
+    else:
+        raise ValueError("mode must be 'record' or 'compare'")
@@ -0,0 +1,306 @@
+"""
+results.py
+
+SQLite-backed store for derived per-run results (scalars such as band
+transmission or noise, and vectors such as transmission spectra), keyed by the
+run metadata encoded in the data filenames. Lets trend plots be rendered from
+stored results without re-running the analysis.
+
+Author: Shiqi Xu
+"""
+
+import re
+import sqlite3
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+RUN_FIELDS = (
+    "filename",
+    "date",
+    "run",
+    "resolution",
+    "gas",
+    "pressure_kpa",
+    "time_s",
+    "scans",
+    "kind",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    filename TEXT UNIQUE NOT NULL,
+    date TEXT,
+    run TEXT,
+    resolution REAL,
+    gas TEXT,
+    pressure_kpa REAL,
+    time_s REAL,
+    scans INTEGER,
+    kind TEXT
+);
+CREATE TABLE IF NOT EXISTS scalars (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    name TEXT NOT NULL,
+    value REAL,
+    uncertainty REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE TABLE IF NOT EXISTS vectors (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    name TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    x BLOB,
+    y BLOB NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_gas_pressure ON runs (gas, pressure_kpa);
+CREATE INDEX IF NOT EXISTS idx_runs_date_run ON runs (date, run);
+CREATE INDEX IF NOT EXISTS idx_scalars_name ON scalars (name, run_id);
+"""
+
+
+def parse_run_metadata(filename: Union[str, Path]) -> Dict[str, object]:
+    """Parses run metadata from a data filename, e.g.
+    "2022-01-28_run13_2.0res_argon_-80kPa_spectrum.CSV" or
+    "2022-02-15_run02_4.0res_2scans_evac_to_air_005s.CSV".
+
+    Args:
+        filename (Union[str, Path]): Data filename or path.
+
+    Returns:
+        Dict[str, object]: Dictionary keyed by RUN_FIELDS. Fields not present in
+            the filename are None.
+    """
+    name = Path(filename).name
+    stem = Path(filename).stem
+    metadata = dict.fromkeys(RUN_FIELDS)
+    metadata["filename"] = name
+
+    tokens = stem.split("_")
+    gases = []
+    for token in tokens:
+        if re.fullmatch(r"\d{4}-\d{2}-\d{2}", token):
+            metadata["date"] = token
+        elif re.fullmatch(r"run\d+[a-z]?", token):
+            metadata["run"] = token
+        elif re.fullmatch(r"\d+(\.\d+)?res", token):
+            metadata["resolution"] = float(token[:-3])
+        elif re.fullmatch(r"-?\d+kPa", token):
+            metadata["pressure_kpa"] = float(token[:-3])
+        elif re.fullmatch(r"\d+s", token):
+            metadata["time_s"] = float(token[:-1])
+        elif re.fullmatch(r"\d+scans?", token):
+            metadata["scans"] = int(token.rstrip("s")[:-4])
+        elif token in ("evac", "air", "argon"):
+            gases.append(token)
+        elif token in ("bkgd", "sample", "spectrum"):
+            metadata["kind"] = token
+    if gases:
+        ## e.g. "evac_to_air" is recorded as the final gas
+        metadata["gas"] = gases[-1]
+
+    return metadata
+
+
+def connect(path_db: Union[str, Path]) -> sqlite3.Connection:
+    """Opens (and creates, if necessary) a results database.
+
+    Args:
+        path_db (Union[str, Path]): Path to SQLite database file.
+
+    Returns:
+        sqlite3.Connection: Open database connection.
+    """
+    conn = sqlite3.connect(str(path_db))
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _run_id(conn: sqlite3.Connection, filename: Union[str, Path]) -> int:
+    """Looks up (or inserts) the run row for a data filename."""
+    metadata = parse_run_metadata(filename)
+    conn.execute(
+        "INSERT OR IGNORE INTO runs ("
+        + ", ".join(RUN_FIELDS)
+        + ") VALUES ("
+        + ", ".join("?" * len(RUN_FIELDS))
+        + ")",
+        [metadata[field] for field in RUN_FIELDS],
+    )
+    row = conn.execute(
+        "SELECT run_id FROM runs WHERE filename = ?", (metadata["filename"],)
+    ).fetchone()
+    return row[0]
+
+
+def store_scalar(
+    conn: sqlite3.Connection,
+    filename: Union[str, Path],
+    name: str,
+    value: float,
+    uncertainty: Optional[float] = None,
+):
+    """Stores (or replaces) a scalar result for a run.
+
+    Args:
+        conn (sqlite3.Connection): Open database connection.
+        filename (Union[str, Path]): Data filename identifying the run.
+        name (str): Name of result, e.g. "co2_transmission".
+        value (float): Result value.
+        uncertainty (float, optional): Uncertainty in result. Defaults to None.
+    """
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO scalars (run_id, name, value, uncertainty) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                _run_id(conn, filename),
+                name,
+                float(value),
+                None if uncertainty is None else float(uncertainty),
+            ),
+        )
+
+
+def store_vector(
+    conn: sqlite3.Connection,
+    filename: Union[str, Path],
+    name: str,
+    y_data: np.ndarray,
+    x_data: Optional[np.ndarray] = None,
+):
+    """Stores (or replaces) a vector result for a run, e.g. a transmission spectrum.
+
+    Args:
+        conn (sqlite3.Connection): Open database connection.
+        filename (Union[str, Path]): Data filename identifying the run.
+        name (str): Name of result, e.g. "transmission".
+        y_data (np.ndarray[float]): Dependent variable data.
+        x_data (np.ndarray[float], optional): Independent variable data, same length
+            as y_data. Defaults to None.
+    """
+    y_data = np.ascontiguousarray(y_data, dtype=np.float64)
+    if x_data is not None:
+        x_data = np.ascontiguousarray(x_data, dtype=np.float64)
+        if x_data.shape != y_data.shape:
+            raise ValueError("x_data and y_data must have the same shape")
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO vectors (run_id, name, dtype, x, y) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                _run_id(conn, filename),
+                name,
+                y_data.dtype.str,
+                None if x_data is None else x_data.tobytes(),
+                y_data.tobytes(),
+            ),
+        )
+
+
+def load_vector(
+    conn: sqlite3.Connection, filename: Union[str, Path], name: str
+) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    """Loads a stored vector result for a run.
+
+    Args:
+        conn (sqlite3.Connection): Open database connection.
+        filename (Union[str, Path]): Data filename identifying the run.
+        name (str): Name of result.
+
+    Returns:
+        Tuple[Optional[np.ndarray[float]], np.ndarray[float]]: Independent variable
+            data (None if not stored) and dependent variable data.
+    """
+    row = conn.execute(
+        "SELECT v.dtype, v.x, v.y FROM vectors v JOIN runs r USING (run_id) "
+        "WHERE r.filename = ? AND v.name = ?",
+        (Path(filename).name, name),
+    ).fetchone()
+    if row is None:
+        raise KeyError(name + " not stored for " + Path(filename).name)
+    dtype, x_blob, y_blob = row
+    x_data = None if x_blob is None else np.frombuffer(x_blob, dtype=dtype)
+    y_data = np.frombuffer(y_blob, dtype=dtype)
+
+    return x_data, y_data
+
+
+def query_scalars(
+    conn: sqlite3.Connection, name: str, order_by: str = "run_id", **filters
+) -> pd.DataFrame:
+    """Queries a scalar result across runs, joined with run metadata.
+
+    Args:
+        conn (sqlite3.Connection): Open database connection.
+        name (str): Name of result.
+        order_by (str, optional): Run metadata field to sort by. Defaults to
+            "run_id".
+        **filters: Run metadata fields to match exactly, e.g. gas="air".
+
+    Returns:
+        pd.DataFrame: One row per run, with run metadata columns plus "value" and
+            "uncertainty".
+    """
+    allowed = ("run_id",) + RUN_FIELDS
+    for field in list(filters) + [order_by]:
+        if field not in allowed:
+            raise ValueError("unknown run metadata field: " + field)
+    query = (
+        "SELECT r.*, s.value, s.uncertainty FROM scalars s "
+        "JOIN runs r USING (run_id) WHERE s.name = ?"
+    )
+    params = [name]
+    for field, value in filters.items():
+        query += " AND r." + field + " = ?"
+        params.append(value)
+    query += " ORDER BY r." + order_by
+
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def export_results(
+    conn: sqlite3.Connection, path_dir: Union[str, Path], fmt: str = "csv"
+):
+    """Bulk exports the run and scalar tables, one file per table. Vectors are
+    exported in long format (one row per point).
+
+    Args:
+        conn (sqlite3.Connection): Open database connection.
+        path_dir (Union[str, Path]): Directory to export into.
+        fmt (str, optional): "csv" or "parquet" (requires pyarrow or fastparquet).
+            Defaults to "csv".
+    """
+    if fmt not in ("csv", "parquet"):
+        raise ValueError("fmt must be 'csv' or 'parquet'")
+    path_dir = Path(path_dir)
+    path_dir.mkdir(parents=True, exist_ok=True)
+
+    tables = {
+        "runs": pd.read_sql_query("SELECT * FROM runs", conn),
+        "scalars": pd.read_sql_query("SELECT * FROM scalars", conn),
+    }
+    vector_frames = []
+    for run_id, name, dtype, x_blob, y_blob in conn.execute(
+        "SELECT run_id, name, dtype, x, y FROM vectors"
+    ):
+        y_data = np.frombuffer(y_blob, dtype=dtype)
+        x_data = None if x_blob is None else np.frombuffer(x_blob, dtype=dtype)
+        vector_frames.append(
+            pd.DataFrame({"run_id": run_id, "name": name, "x": x_data, "y": y_data})
+        )
+    tables["vectors"] = (
+        pd.concat(vector_frames, ignore_index=True)
+        if vector_frames
+        else pd.DataFrame(columns=["run_id", "name", "x", "y"])
+    )
+
+    for table_name, table in tables.items():
+        if fmt == "csv":
+            table.to_csv(path_dir / (table_name + ".csv"), index=False)
+        else:
+            table.to_parquet(path_dir / (table_name + ".parquet"), index=False)
@@ -0,0 +1,240 @@
+"""
+screening.py
+
+Cheap quality checks on interferograms and single-beam spectra, run before the
+Fourier transform and fitting stages, so that bad ("wavy") acquisitions are
+flagged or skipped in batch mode. All checks are vectorized over a stack of
+interferograms or spectra.
+
+Author: Shiqi Xu
+"""
+
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import spectra
+
+## default pass/fail limits, tuned on the 2022-01-25 and 2022-01-28 data
+IFG_LIMITS = {
+    "min_burst_amplitude": 0.01,  # V
+    "max_burst_offset": 32,  # data points from centre of acquired region
+    "max_clipped_points": 3,  # points sitting at the max. or min. value
+    "saturation_level": None,  # V; None to only check for clipping
+    ## low-frequency variance / variance away from burst; None to only report it.
+    ## On all 42 interferograms here the ratio is <= 1.1e-4 and the wavy file
+    ## (5.5e-5) is indistinguishable from good ones, so no limit is set by default
+    "max_drift_ratio": None,
+}
+SPECTRUM_LIMITS = {
+    "noise_window": (2398, 2603),  # cm^{-1}, as used in snr.py
+    "max_rel_noise": 0.01,  # RMS about linear trend / mean level
+}
+
+
+def acquired_length(ifg_y: np.ndarray) -> np.ndarray:
+    """Finds the number of acquired (non-zero-filled) points in each interferogram.
+
+    Args:
+        ifg_y (np.ndarray[float]): 2-D array of interferograms, one per row.
+
+    Returns:
+        np.ndarray[int]: Index after the last non-zero point, for each row.
+    """
+    nonzero = ifg_y != 0
+    last = ifg_y.shape[1] - np.argmax(nonzero[:, ::-1], axis=1)
+    return np.where(nonzero.any(axis=1), last, 0)
+
+
+def screen_interferograms(
+    ifg_y: np.ndarray, block_size: int = 1024, burst_half_width: int = 512, **limits
+) -> pd.DataFrame:
+    """Screens a stack of interferograms for centre-burst amplitude and position,
+    detector saturation and low-frequency drift. Trailing zero-fill is ignored.
+    The drift ratio is informational unless IFG_LIMITS["max_drift_ratio"] is set.
+
+    Args:
+        ifg_y (np.ndarray[float]): Interferogram, or 2-D array of interferograms
+            (one per row), in units of Volts.
+        block_size (int, optional): Block length, in data points, over which the
+            interferogram is averaged to estimate low-frequency drift.
+            Defaults to 1024.
+        burst_half_width (int, optional): Half-width, in data points, of the region
+            around the centre burst excluded from the drift estimate.
+            Defaults to 512.
+        **limits: Overrides for the entries of IFG_LIMITS.
+
+    Returns:
+        pd.DataFrame: One row per interferogram, with the measured metrics, a
+            boolean column per check, and "passed".
+    """
+    limits = {**IFG_LIMITS, **limits}
+    ifg_y = np.atleast_2d(np.asarray(ifg_y, dtype=np.float64))
+    n_ifg, n_points = ifg_y.shape
+    point_index = np.arange(n_points)
+
+    n_acquired = acquired_length(ifg_y)
+    acquired = point_index < n_acquired[:, None]
+    y_masked = np.where(acquired, ifg_y, np.nan)
+    y_centred = y_masked - np.nanmedian(y_masked, axis=1, keepdims=True)
+
+    ## centre burst
+    burst_position = np.nanargmax(np.abs(y_centred), axis=1)
+    burst_amplitude = np.abs(y_centred[np.arange(n_ifg), burst_position])
+    burst_offset = burst_position - n_acquired // 2
+
+    ## saturation: repeated extreme values, or values beyond the detector limit
+    y_max = np.nanmax(y_masked, axis=1, keepdims=True)
+    y_min = np.nanmin(y_masked, axis=1, keepdims=True)
+    clipped_points = np.maximum(
+        np.sum(y_masked == y_max, axis=1), np.sum(y_masked == y_min, axis=1)
+    )
+    saturated = clipped_points > limits["max_clipped_points"]
+    if limits["saturation_level"] is not None:
+        saturated |= np.nanmax(np.abs(y_masked), axis=1) >= limits["saturation_level"]
+
+    ## low-frequency drift: variance of block means, relative to the variance of
+    ## the interferogram away from the centre burst
+    away_from_burst = np.abs(point_index - burst_position[:, None]) > burst_half_width
+    y_wings = np.where(away_from_burst, y_centred, np.nan)
+    n_blocks = n_points // block_size
+    blocks = y_wings[:, : n_blocks * block_size].reshape(n_ifg, n_blocks, block_size)
+    block_counts = np.sum(~np.isnan(blocks), axis=2)
+    block_means = np.where(
+        block_counts > 0,
+        np.nansum(blocks, axis=2) / np.maximum(block_counts, 1),
+        np.nan,
+    )
+    drift_ratio = np.nanvar(block_means, axis=1) / np.nanvar(y_wings, axis=1)
+
+    report = pd.DataFrame(
+        {
+            "acquired_points": n_acquired,
+            "burst_position": burst_position,
+            "burst_offset": burst_offset,
+            "burst_amplitude": burst_amplitude,
+            "clipped_points": clipped_points,
+            "drift_ratio": drift_ratio,
+        }
+    )
+    report["burst_ok"] = (burst_amplitude >= limits["min_burst_amplitude"]) & (
+        np.abs(burst_offset) <= limits["max_burst_offset"]
+    )
+    report["saturation_ok"] = ~saturated
+    if limits["max_drift_ratio"] is None:
+        report["drift_ok"] = True
+    else:
+        report["drift_ok"] = drift_ratio <= limits["max_drift_ratio"]
+    report["passed"] = report["burst_ok"] & report["saturation_ok"] & report["drift_ok"]
+
+    return report
+
+
+def screen_spectra(
+    wavenumber_data: np.ndarray, y_data: np.ndarray, **limits
+) -> pd.DataFrame:
+    """Screens a stack of single-beam spectra for excess noise in a quiet region.
+
+    Args:
+        wavenumber_data (np.ndarray[float]): Ascending wavenumber data, shared by
+            all spectra.
+        y_data (np.ndarray[float]): Spectrum, or 2-D array of spectra (one per row).
+        **limits: Overrides for the entries of SPECTRUM_LIMITS.
+
+    Returns:
+        pd.DataFrame: One row per spectrum, with "rel_noise", "noise_ok" and
+            "passed".
+    """
+    limits = {**SPECTRUM_LIMITS, **limits}
+    y_data = np.atleast_2d(np.asarray(y_data, dtype=np.float64))
+    min_wavenumber, max_wavenumber = limits["noise_window"]
+    in_window = (wavenumber_data >= min_wavenumber) & (
+        wavenumber_data <= max_wavenumber
+    )
+    x_window = wavenumber_data[in_window]
+    y_window = y_data[:, in_window]
+
+    ## RMS about a linear trend, fitted to all spectra at once
+    design = np.stack([np.ones_like(x_window), x_window - np.mean(x_window)], axis=-1)
+    coeffs, _, _, _ = np.linalg.lstsq(design, y_window.T, rcond=None)
+    residuals = y_window - (design @ coeffs).T
+    rel_noise = np.std(residuals, axis=1) / np.abs(np.mean(y_window, axis=1))
+
+    report = pd.DataFrame({"rel_noise": rel_noise})
+    report["noise_ok"] = rel_noise <= limits["max_rel_noise"]
+    report["passed"] = report["noise_ok"]
+
+    return report
+
+
+def screen_files(
+    paths_csv: Sequence[Union[str, Path]], kind: str = "ifg", **limits
+) -> pd.DataFrame:
+    """Screens interferogram or spectrum CSV files, grouping files of equal length
+    into stacks.
+
+    Args:
+        paths_csv (Sequence[Union[str, Path]]): Paths to CSV files.
+        kind (str, optional): "ifg" for interferograms, "spectrum" for single-beam
+            spectra. Defaults to "ifg".
+        **limits: Overrides for IFG_LIMITS or SPECTRUM_LIMITS.
+
+    Returns:
+        pd.DataFrame: Screening report indexed by filename, in input order.
+    """
+    if kind not in ("ifg", "spectrum"):
+        raise ValueError("kind must be 'ifg' or 'spectrum'")
+    data = [spectra.read_data(path) for path in paths_csv]
+    groups: Dict[Tuple[int, float], List[int]] = {}
+    for i, (x_data, _) in enumerate(data):
+        groups.setdefault((len(x_data), x_data[0]), []).append(i)
+
+    reports = []
+    for indices in groups.values():
+        y_stack = np.stack([data[i][1] for i in indices])
+        if kind == "ifg":
+            report = screen_interferograms(y_stack, **limits)
+        else:
+            report = screen_spectra(data[indices[0]][0], y_stack, **limits)
+        report.index = indices
+        reports.append(report)
+    report = pd.concat(reports).sort_index()
+    report.index = [Path(path).name for path in paths_csv]
+
+    return report
+
+
+def passed_files(
+    paths_csv: Sequence[Union[str, Path]], kind: str = "ifg", **limits
+) -> List[Path]:
+    """Returns only the files that pass screening.
+
+    Args:
+        paths_csv (Sequence[Union[str, Path]]): Paths to CSV files.
+        kind (str, optional): "ifg" or "spectrum". Defaults to "ifg".
+        **limits: Overrides for IFG_LIMITS or SPECTRUM_LIMITS.
+
+    Returns:
+        List[pathlib.Path]: Paths of files that passed, in input order.
+    """
+    report = screen_files(paths_csv, kind, **limits)
+    return [Path(path) for path, ok in zip(paths_csv, report["passed"]) if ok]
+
+
+if __name__ == "__main__":
+
+    data_files = []
+    for date in ["2022-01-21", "2022-01-25", "2022-01-28"]:
+        data_path = Path.cwd() / "data" / date
+        for csv_file in data_path.iterdir():
+            data_files.append(csv_file)
+    data_files.sort()
+
+    ifg_files = [path for path in data_files if "_ifg" in path.name]
+    spectrum_files = [path for path in data_files if "_ifg" not in path.name]
+
+    pd.set_option("display.width", 200)
+    print(screen_files(ifg_files, kind="ifg"))
+    print(screen_files(spectrum_files, kind="spectrum"))
@@ -0,0 +1,370 @@
+"""
+sharedarrays.py
+
+Zero-copy hand-off of arrays between pipeline stages running in separate
+processes. Each array is written once into a multiprocessing.shared_memory
+segment, and only a small descriptor (segment name, shape, dtype and metadata)
+is passed between processes; downstream workers read the array in place instead
+of unpickling a copy. Stage functions for reading, Fourier transforming,
+background ratioing and band fitting of interferograms are included, together
+with a runner that chains them over a process pool.
+
+Segments outlive the stage that created them (POSIX shared memory), and are
+freed with release(). The pool's processes share the main process's resource
+tracker, so segments that are never released are still unlinked when the main
+process exits. Not supported on Windows, where a segment is freed as soon as
+its last handle closes.
+
+Author: Shiqi Xu
+"""
+
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import chunked
+import screening
+import spectra
+
+
+def share(array: np.ndarray, metadata: Dict = None) -> Dict:
+    """Copies an array into a new shared memory segment.
+
+    Args:
+        array (np.ndarray): Array to share.
+        metadata (Dict, optional): Small picklable values travelling with the
+            array, e.g. the source file. Defaults to None.
+
+    Returns:
+        Dict: Descriptor, with "name" (segment), "shape", "dtype" and "metadata".
+    """
+    array = np.asarray(array)
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+    shared[...] = array
+    descriptor = {
+        "name": segment.name,
+        "shape": array.shape,
+        "dtype": array.dtype.str,
+        "metadata": dict(metadata or {}),
+    }
+    del shared
+    segment.close()
+    return descriptor
+
+
+def allocate(shape: Tuple[int, ...], dtype="float64", metadata: Dict = None) -> Dict:
+    """Creates an uninitialized shared array, for a stage to write into.
+
+    Args:
+        shape (Tuple[int, ...]): Array shape.
+        dtype (optional): Array dtype. Defaults to "float64".
+        metadata (Dict, optional): Small picklable values. Defaults to None.
+
+    Returns:
+        Dict: Descriptor of the new array.
+    """
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    descriptor = {
+        "name": segment.name,
+        "shape": tuple(shape),
+        "dtype": dtype.str,
+        "metadata": dict(metadata or {}),
+    }
+    segment.close()
+    return descriptor
+
+
+@contextmanager
+def attach(descriptor: Dict, writable: bool = False) -> Iterator[np.ndarray]:
+    """Maps a shared array into this process, without copying.
+
+    The view is only valid inside the with block; copy anything needed
+    afterwards.
+
+    Args:
+        descriptor (Dict): Descriptor from share or allocate.
+        writable (bool, optional): Whether the view may be written to.
+            Defaults to False.
+
+    Yields:
+        np.ndarray: View of the shared array.
+    """
+    segment = shared_memory.SharedMemory(name=descriptor["name"])
+    try:
+        view = np.ndarray(
+            descriptor["shape"],
+            dtype=np.dtype(descriptor["dtype"]),
+            buffer=segment.buf,
+        )
+        view.flags.writeable = writable
+        yield view
+    finally:
+        view = None
+        segment.close()
+
+
+def release(descriptor: Dict):
+    """Frees a shared array. Any process may release it, once, after the last
+    stage that reads it."""
+    segment = shared_memory.SharedMemory(name=descriptor["name"])
+    segment.close()
+    segment.unlink()
+
+
+## pipeline stages: each takes and returns descriptors (or small results)
+
+
+def _check_pair(bkgd_points: int, sample_points: int, path_sample: str):
+    """Raises ValueError if a background and sample interferogram were acquired
+    with different numbers of points, as their single beams are then on different
+    intensity scales and their ratio is not a transmission."""
+    if bkgd_points != sample_points:
+        raise ValueError(
+            "background and sample of "
+            + path_sample
+            + " differ in acquired points ("
+            + str(bkgd_points)
+            + " vs "
+            + str(sample_points)
+            + ")"
+        )
+
+
+def read_stage(path_csv: Union[str, Path]) -> Dict:
+    """Reads a CSV file into a shared (2 x no. of points) array of x and y data,
+    with the number of acquired (non-zero-filled) points in its metadata."""
+    x_data, y_data = spectra.read_data(path_csv)
+    acquired_points = int(screening.acquired_length(y_data[None, :])[0])
+    return share(
+        np.stack([x_data, y_data]),
+        {"path": str(path_csv), "acquired_points": acquired_points},
+    )
+
+
+def fft_stage(args) -> Dict:
+    """Fourier transforms a shared interferogram into a shared (2 x no. of
+    wavenumbers) array of wavenumbers and single-beam intensities."""
+    descriptor, wavenumber_res, min_wavenumber, max_wavenumber = args
+    with attach(descriptor) as ifg:
+        spectrum_x, spectrum_y = chunked.fourier_transform_batch(
+            ifg[1], wavenumber_res, min_wavenumber, max_wavenumber
+        )
+    spectrum = allocate((2, len(spectrum_x)), metadata=descriptor["metadata"])
+    with attach(spectrum, writable=True) as output:
+        output[0] = spectrum_x
+        output[1] = spectrum_y[0]
+    return spectrum
+
+
+def ratio_stage(args) -> Dict:
+    """Ratios a shared sample spectrum against a shared background spectrum on the
+    same wavenumber grid and acquired from the same number of points, into a
+    shared array of % transmission."""
+    bkgd, sample = args
+    _check_pair(
+        bkgd["metadata"]["acquired_points"],
+        sample["metadata"]["acquired_points"],
+        sample["metadata"]["path"],
+    )
+    with attach(bkgd) as bkgd_xy, attach(sample) as sample_xy:
+        if not np.array_equal(bkgd_xy[0], sample_xy[0]):
+            raise ValueError("background and sample grids differ")
+        ## allocated only once both checks pass, so a rejected pair leaves no
+        ## segment behind
+        transmission = allocate(sample["shape"], metadata=sample["metadata"])
+        with attach(transmission, writable=True) as output:
+            output[0] = sample_xy[0]
+            np.divide(sample_xy[1], bkgd_xy[1], out=output[1])
+            output[1] *= 100
+    return transmission
+
+
+def fit_stage(args) -> Dict:
+    """Band integrals of a shared transmission spectrum (returned as a small dict,
+    not shared)."""
+    descriptor, windows = args
+    with attach(descriptor) as xy:
+        integrals = chunked.band_integrals(xy[0], xy[1], windows)[0]
+    return {
+        "path": descriptor["metadata"]["path"],
+        **{
+            str(window[0]) + "-" + str(window[1]): integral
+            for window, integral in zip(windows, integrals)
+        },
+    }
+
+
+def _map_stage(
+    executor: Executor, stage: Callable, args: Sequence, descriptors: List[Dict]
+) -> List[Dict]:
+    """Runs a stage over its arguments on a pool, adding each output descriptor
+    to descriptors as it arrives, so that outputs of tasks that succeeded are
+    still released when another task of the stage raises.
+
+    Args:
+        executor (Executor): Process pool.
+        stage (Callable): Stage function, returning a descriptor.
+        args (Sequence): Argument of each task.
+        descriptors (List[Dict]): Descriptors to release, appended to in place.
+
+    Returns:
+        List[Dict]: Output descriptors, in the order of args.
+    """
+    futures = {executor.submit(stage, arg): i for i, arg in enumerate(args)}
+    outputs: List[Dict] = [None] * len(futures)
+    error = None
+    for future in as_completed(futures):
+        try:
+            outputs[futures[future]] = future.result()
+        except Exception as exc:
+            ## raised once every task of the stage has finished
+            error = error or exc
+            continue
+        descriptors.append(outputs[futures[future]])
+    if error is not None:
+        raise error
+    return outputs
+
+
+def run_shared(
+    pairs: Sequence[Tuple[Union[str, Path], Union[str, Path]]],
+    wavenumber_res: float,
+    windows: Sequence[Tuple[float, float]],
+    min_wavenumber: float = 400,
+    max_wavenumber: float = 4000,
+    n_workers: int = None,
+) -> pd.DataFrame:
+    """Runs read -> FFT -> ratio -> fit over (background, sample) interferogram
+    pairs on a process pool, handing arrays between stages in shared memory.
+
+    Args:
+        pairs (Sequence[Tuple[Union[str, Path], Union[str, Path]]]): Paths to
+            (background, sample) interferogram CSV files.
+        wavenumber_res (float): Wavenumber spacing, in cm^{-1}.
+        windows (Sequence[Tuple[float, float]]): (min, max) wavenumber windows.
+        min_wavenumber (float, optional): Lower wavenumber of window. Defaults to 400.
+        max_wavenumber (float, optional): Upper wavenumber of window. Defaults to 4000.
+        n_workers (int, optional): Number of worker processes. Defaults to None
+            (one per CPU).
+
+    Returns:
+        pd.DataFrame: Band integrals of % transmission, one row per sample file.
+    """
+    windows = [tuple(window) for window in windows]
+    paths = [path for pair in pairs for path in pair]
+    descriptors: List[Dict] = []
+    ## started before the pool, so that the workers share it and segments they
+    ## create are not unlinked when they exit
+    resource_tracker.ensure_running()
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            ifgs = _map_stage(executor, read_stage, paths, descriptors)
+            fft_args = [
+                (ifg, wavenumber_res, min_wavenumber, max_wavenumber) for ifg in ifgs
+            ]
+            single_beams = _map_stage(executor, fft_stage, fft_args, descriptors)
+            transmissions = _map_stage(
+                executor,
+                ratio_stage,
+                list(zip(single_beams[0::2], single_beams[1::2])),
+                descriptors,
+            )
+            fit_args = [(transmission, windows) for transmission in transmissions]
+            rows = list(executor.map(fit_stage, fit_args))
+    finally:
+        for descriptor in descriptors:
+            release(descriptor)
+
+    return pd.DataFrame(rows).set_index("path")
+
+
+## the same stages, passing pickled arrays, for comparison
+
+
+def _read_pickled(path_csv: Union[str, Path]) -> Tuple[np.ndarray, Dict]:
+    xy = np.stack(spectra.read_data(path_csv))
+    acquired_points = int(screening.acquired_length(xy[1][None, :])[0])
+    return xy, {"path": str(path_csv), "acquired_points": acquired_points}
+
+
+def _fft_pickled(args) -> Tuple[np.ndarray, Dict]:
+    (ifg, metadata), wavenumber_res, min_wavenumber, max_wavenumber = args
+    spectrum_x, spectrum_y = chunked.fourier_transform_batch(
+        ifg[1], wavenumber_res, min_wavenumber, max_wavenumber
+    )
+    return np.stack([spectrum_x, spectrum_y[0]]), metadata
+
+
+def _ratio_pickled(args) -> np.ndarray:
+    (bkgd_xy, bkgd_metadata), (sample_xy, sample_metadata) = args
+    _check_pair(
+        bkgd_metadata["acquired_points"],
+        sample_metadata["acquired_points"],
+        sample_metadata["path"],
+    )
+    if not np.array_equal(bkgd_xy[0], sample_xy[0]):
+        raise ValueError("background and sample grids differ")
+    return np.stack([sample_xy[0], sample_xy[1] / bkgd_xy[1] * 100])
+
+
+def _fit_pickled(args) -> np.ndarray:
+    xy, windows = args
+    return chunked.band_integrals(xy[0], xy[1], windows)[0]
+
+
+def run_pickled(
+    pairs: Sequence[Tuple[Union[str, Path], Union[str, Path]]],
+    wavenumber_res: float,
+    windows: Sequence[Tuple[float, float]],
+    min_wavenumber: float = 400,
+    max_wavenumber: float = 4000,
+    n_workers: int = None,
+) -> pd.DataFrame:
+    """As run_shared, but passing arrays between stages by pickling."""
+    windows = [tuple(window) for window in windows]
+    paths = [path for pair in pairs for path in pair]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        ifgs = list(executor.map(_read_pickled, paths))
+        fft_args = [
+            (ifg, wavenumber_res, min_wavenumber, max_wavenumber) for ifg in ifgs
+        ]
+        single_beams = list(executor.map(_fft_pickled, fft_args))
+        transmissions = list(
+            executor.map(_ratio_pickled, zip(single_beams[0::2], single_beams[1::2]))
+        )
+        fit_args = [(transmission, windows) for transmission in transmissions]
+        integrals = list(executor.map(_fit_pickled, fit_args))
+    columns = [str(window[0]) + "-" + str(window[1]) for window in windows]
+    return pd.DataFrame(
+        integrals, index=[str(pair[1]) for pair in pairs], columns=columns
+    ).rename_axis("path")
+
+
+if __name__ == "__main__":
+
+    ## the _bkgd_ifg files of 2022-01-25 have twice the acquired points of the
+    ## _sample_ifg files, so ratio_stage rejects them as backgrounds; the air
+    ## sample interferograms are ratioed against the evacuated one instead
+    data_path = Path.cwd() / "data" / "2022-01-25"
+    evac = data_path / "2022-01-25_run00_2.0res_evac_-93kPa_sample_ifg.CSV"
+    pairs = [
+        (evac, sample) for sample in sorted(data_path.glob("*_air_*_sample_ifg.CSV"))
+    ]
+
+    timings = {}
+    for name, run in [("pickled", run_pickled), ("shared", run_shared)]:
+        start = time.perf_counter()
+        df_integrals = run(pairs, 0.241, [(2200, 2500), (2280, 2390)])
+        timings[name] = time.perf_counter() - start
+    print("band integrals of % transmission (air vs evacuated cell):")
+    print(df_integrals)
+    print("run time (s):", timings)
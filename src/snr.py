@@ -7,12 +7,15 @@ Signal is omitted as it remains constant throughout this dataset.
 Standalone script.
 """
 
+import sys
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import results
+
 ## data
 no_scans = np.array([1, 2, 4, 8, 16, 32, 64])
 no_scans_log2 = np.log2(no_scans)
@@ -31,6 +34,46 @@ try:
 except OSError:
     pass
 
+## spectra measured for the scan-count series, in the same order as no_scans
+noise_files = [
+    "2022-02-11_run02_2.0res_evac_-91kPa_1scan.CSV",
+    "2022-02-11_run03_2.0res_evac_-91kPa_2scans.CSV",
+    "2022-02-11_run04_2.0res_evac_-91kPa_4scans.CSV",
+    "2022-02-11_run05_2.0res_evac_-91kPa_8scans.CSV",
+    "2022-02-11_run06_2.0res_evac_-91kPa_16scans.CSV",
+    "2022-02-11_run07_2.0res_evac_-91kPa_32scans.CSV",
+    "2022-02-11_run08_2.0res_evac_-91kPa_64scans.CSV",
+]
+
+def store_noise(conn):
+    """Writes the measured noise values into the results database.
+
+    Args:
+        conn (sqlite3.Connection): Open results database connection.
+    """
+    for i in range(len(noise_files)):
+        results.store_scalar(conn, noise_files[i], "p2p_noise_2398_2603", p2p_noise[i])
+        results.store_scalar(conn, noise_files[i], "rms_noise_2398_2603", rms_noise[i])
+
+def load_noise(conn):
+    """Reads the noise values back from the results database.
+
+    Args:
+        conn (sqlite3.Connection): Open results database connection.
+
+    Returns:
+        pd.DataFrame: Peak-to-peak and RMS noise, indexed by scan count.
+    """
+    df_p2p = results.query_scalars(conn, "p2p_noise_2398_2603", order_by="scans")
+    df_rms = results.query_scalars(conn, "rms_noise_2398_2603", order_by="scans")
+    return pd.DataFrame(
+        {
+            "no_scans": df_p2p["scans"].to_numpy(),
+            "peak_to_peak": df_p2p["value"].to_numpy(),
+            "rms": df_rms["value"].to_numpy(),
+        }
+    ).set_index("no_scans")
+
 def plot_p2p(save_fig=False):
 
     plt.figure()
@@ -173,6 +216,19 @@ def plot_inv_rms(save_fig=False):
 
 if __name__ == "__main__":
 
+    ## render from stored results; the measured values are only written when
+    ## missing from the store (or when run as "python src/snr.py store")
+    conn = results.connect(Path.cwd() / "outputs" / "results.sqlite")
+    df_noise = load_noise(conn)
+    if "store" in sys.argv[1:] or len(df_noise) < len(noise_files):
+        store_noise(conn)
+        df_noise = load_noise(conn)
+    no_scans = df_noise.index.to_numpy()
+    no_scans_log2 = np.log2(no_scans)
+    no_scans_sqrt = np.sqrt(no_scans)
+    p2p_noise = df_noise["peak_to_peak"].to_numpy()
+    rms_noise = df_noise["rms"].to_numpy()
+
     plot_inv_p2p(save_fig=True)
 
     plot_inv_rms(save_fig=True)
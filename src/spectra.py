@@ -229,9 +229,9 @@ def tot_transmission(
         end += 1
     wavenumber_cropped = wavenumber_data[start:end]
     transmission_cropped = transmission_data[start:end]
-    total_transmission = integrate.trapz(transmission_cropped, wavenumber_cropped) / (
-        max_wavenumber - min_wavenumber
-    )
+    total_transmission = integrate.trapezoid(
+        transmission_cropped, wavenumber_cropped
+    ) / (max_wavenumber - min_wavenumber)
 
     return total_transmission
 
@@ -244,7 +244,9 @@ def fourier_transform(
     ref_spectrum_y: np.ndarray = None,
     plot: bool = False,
     save_fig: bool = False,
-    path_save: Union[str, Path] = None
+    path_save: Union[str, Path] = None,
+    min_wavenumber: float = 400,
+    max_wavenumber: float = 4000,
     ) -> Tuple[np.ndarray, np.ndarray]:
     """Performs the Fourier transform on an input interferogram to output a
     single-beam spectrum. Optionally generates a plot of the single-beam spectrum.
@@ -260,6 +262,10 @@ def fourier_transform(
         plot (bool, optional): Whether to generate a plot. Defaults to False.
         save_fig (bool, optional): Whether to save output figure. Defaults to False.
         path_save (str, optional): Path to save output figure. Defaults to None.
+        min_wavenumber (float, optional): Lower wavenumber of output spectrum.
+            Defaults to 400.
+        max_wavenumber (float, optional): Upper wavenumber of output spectrum.
+            Defaults to 4000.
 
     Returns:
         Tuple[np.ndarray[float], np.ndarray[float]]: Arrays containing wavenumber data
@@ -269,10 +275,10 @@ def fourier_transform(
     spectrum_x = np.fft.fftfreq(len(ifg_x), 1/wavenumber_res/len(ifg_x))
 
     start = 0
-    while spectrum_x[start] < 400:
+    while spectrum_x[start] < min_wavenumber:
         start += 1
     end = start
-    while spectrum_x[end] < 4000:
+    while spectrum_x[end] < max_wavenumber:
         end += 1
     spectrum_x_cropped = spectrum_x[start:end]
     spectrum_y_cropped = spectrum_y[start:end]
@@ -281,46 +287,94 @@ def fourier_transform(
     spectrum_x_filtered = spectrum_x_cropped
     spectrum_y_filtered = np.abs(spectrum_y_cropped)
 
-    ## take upper envelope
+    if plot:
+        plot_fourier_spectrum(
+            spectrum_x_filtered,
+            spectrum_y_filtered,
+            ref_spectrum_x=ref_spectrum_x,
+            ref_spectrum_y=ref_spectrum_y,
+            save_fig=save_fig,
+            path_save=path_save,
+        )
+
+    return spectrum_x_filtered, spectrum_y_filtered
+
+
+def upper_envelope(
+    spectrum_x: np.ndarray, spectrum_y: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Takes the upper envelope of a single-beam spectrum from the Fourier
+    transform, for plotting.
+
+    Args:
+        spectrum_x (np.ndarray[float]): Wavenumber data, in cm^{-1}.
+        spectrum_y (np.ndarray[float]): Single-beam intensity data.
+
+    Returns:
+        Tuple[np.ndarray[float], np.ndarray[float]]: Wavenumber and intensity data
+            of the envelope.
+    """
     spectrum_x_envelope, spectrum_y_envelope = [], []
     x_peaks, y_peaks = [], []
     x_troughs, y_troughs = [], []
-    for i in range(1, len(spectrum_x_filtered)-1):
-        if (spectrum_y_filtered[i] - spectrum_y_filtered[i-1] > 0) and (spectrum_y_filtered[i] - spectrum_y_filtered[i+1] < 0):
-            x_peaks.append(spectrum_x_filtered[i])
-            y_peaks.append(spectrum_y_filtered[i])
-        if (spectrum_y_filtered[i] - spectrum_y_filtered[i-1] < 0) and (spectrum_y_filtered[i] - spectrum_y_filtered[i+1] > 0):
-            x_troughs.append(spectrum_x_filtered[i])
-            y_troughs.append(spectrum_y_filtered[i])
+    for i in range(1, len(spectrum_x)-1):
+        if (spectrum_y[i] - spectrum_y[i-1] > 0) and (spectrum_y[i] - spectrum_y[i+1] < 0):
+            x_peaks.append(spectrum_x[i])
+            y_peaks.append(spectrum_y[i])
+        if (spectrum_y[i] - spectrum_y[i-1] < 0) and (spectrum_y[i] - spectrum_y[i+1] > 0):
+            x_troughs.append(spectrum_x[i])
+            y_troughs.append(spectrum_y[i])
     y_troughs_interp = np.interp(x_peaks, x_troughs, y_troughs)
     for i in range(len(x_peaks)):
         spectrum_y_envelope.append(max(y_peaks[i], y_troughs_interp[i]))
     spectrum_y_envelope = np.array(spectrum_y_envelope)
     spectrum_x_envelope = np.array(x_peaks)
 
-    if plot:
-        if (ref_spectrum_x is not None) and (ref_spectrum_y is not None):
-            overlay_spectra(
-                [ref_spectrum_x, spectrum_x_envelope],
-                [ref_spectrum_y, spectrum_y_envelope],
-                "Single-Beam Spectrum, FFT'd from Interferogram",
-                "Wavenumber (cm$^{-1}$)",
-                "Single-Beam Intensity (arbitrary units)",
-                ["reference", "from FFT"],
-                x_inv=True,
-                save_fig=save_fig,
-                path_save=path_save,
-            )
-        else:
-            plot_spectrum(
-                spectrum_x_envelope,
-                spectrum_y_envelope,
-                "Single-Beam Spectrum, FFT'd from Interferogram",
-                "Wavenumber (cm$^{-1}$)",
-                "Single-Beam Intensity (arbitrary units)",
-                x_inv=True,
-                save_fig=save_fig,
-                path_save=path_save,
-            )
+    return spectrum_x_envelope, spectrum_y_envelope
 
-    return spectrum_x_filtered, spectrum_y_filtered
+
+def plot_fourier_spectrum(
+    spectrum_x: np.ndarray,
+    spectrum_y: np.ndarray,
+    ref_spectrum_x: np.ndarray = None,
+    ref_spectrum_y: np.ndarray = None,
+    save_fig: bool = False,
+    path_save: Union[str, Path] = None,
+    ):
+    """Plots the upper envelope of a single-beam spectrum from the Fourier
+    transform, optionally overlaid on a reference spectrum.
+
+    Args:
+        spectrum_x (np.ndarray[float]): Wavenumber data, in cm^{-1}.
+        spectrum_y (np.ndarray[float]): Single-beam intensity data.
+        ref_spectrum_x (np.ndarray[float]): Wavenumber data of reference single-beam
+            spectrum, in cm^{-1}.
+        ref_spectrum_y (np.ndarray[float]): Intensity data of reference single-beam
+            spectrum, in arbitrary units.
+        save_fig (bool, optional): Whether to save output figure. Defaults to False.
+        path_save (str, optional): Path to save output figure. Defaults to None.
+    """
+    spectrum_x_envelope, spectrum_y_envelope = upper_envelope(spectrum_x, spectrum_y)
+    if (ref_spectrum_x is not None) and (ref_spectrum_y is not None):
+        overlay_spectra(
+            [ref_spectrum_x, spectrum_x_envelope],
+            [ref_spectrum_y, spectrum_y_envelope],
+            "Single-Beam Spectrum, FFT'd from Interferogram",
+            "Wavenumber (cm$^{-1}$)",
+            "Single-Beam Intensity (arbitrary units)",
+            ["reference", "from FFT"],
+            x_inv=True,
+            save_fig=save_fig,
+            path_save=path_save,
+        )
+    else:
+        plot_spectrum(
+            spectrum_x_envelope,
+            spectrum_y_envelope,
+            "Single-Beam Spectrum, FFT'd from Interferogram",
+            "Wavenumber (cm$^{-1}$)",
+            "Single-Beam Intensity (arbitrary units)",
+            x_inv=True,
+            save_fig=save_fig,
+            path_save=path_save,
+        )
@@ -0,0 +1,195 @@
+"""
+sweep.py
+
+Runs a configured analysis pipeline over a parameter grid (see config.py).
+Intermediate arrays (file reads, background ratios and Fourier transforms) are
+cached and shared across grid points, so sweeping an analysis window re-reads
+and re-transforms nothing.
+
+Usage:
+    python src/sweep.py configs/co2_window_sweep.toml
+
+Author: Shiqi Xu
+"""
+
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import chunked
+import config
+import fftcache
+import spectra
+import water
+
+
+class ArrayCache:
+    """Memoizes intermediate arrays shared between grid points, with counters of
+    how often each stage actually ran. Fourier transforms go through a
+    content-addressed fftcache.FFTCache, which can persist across runs."""
+
+    def __init__(self, fft_cache: fftcache.FFTCache = None):
+        self._store = {}
+        self.computed = {"read": 0, "ratio": 0, "fft": 0}
+        self.fft_cache = fftcache.FFTCache() if fft_cache is None else fft_cache
+
+    def _get(self, key: tuple, stage: str, compute: Callable):
+        if key not in self._store:
+            self._store[key] = compute()
+            self.computed[stage] += 1
+        return self._store[key]
+
+    def read(self, path: Path) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached spectra.read_data."""
+        return self._get(("read", str(path)), "read", lambda: spectra.read_data(path))
+
+    def ratio(self, bkgd: Path, sample: Path) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached spectra.background_ratio."""
+        return self._get(
+            ("ratio", str(bkgd), str(sample)),
+            "ratio",
+            lambda: spectra.background_ratio(bkgd, sample),
+        )
+
+    def fft(self, path: Path, fft_config: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached single-beam spectrum of an interferogram file."""
+        _, ifg_y = self.read(path)
+        misses = self.fft_cache.stats["misses"]
+        spectrum_x, spectrum_y = self.fft_cache.transform(
+            ifg_y,
+            fft_config["wavenumber_res"],
+            zero_fill=fft_config["zero_fill"],
+            apodization=fft_config["apodization"],
+            min_wavenumber=fft_config["min_wavenumber"],
+            max_wavenumber=fft_config["max_wavenumber"],
+        )
+        self.computed["fft"] += self.fft_cache.stats["misses"] - misses
+        return spectrum_x, spectrum_y[0]
+
+
+def _label(path: Path, job_config: Dict) -> str:
+    start, stop = job_config["filenames"]["label_slice"]
+    return str(path.name)[start:stop]
+
+
+def run_co2_transmission(job_config: Dict, cache: ArrayCache) -> List[Dict]:
+    """Total % transmission over the CO2 band, per sample (as in analysis.py)."""
+    bkgd = Path(job_config["co2"]["background"])
+    crop_min, crop_max = job_config["co2"]["crop_window"]
+    band_min, band_max = job_config["co2"]["band_window"]
+    rows = []
+    for sample in config.expand_paths(job_config["co2"]["samples"]):
+        wavenumbers, transmission = cache.ratio(bkgd, sample)
+        x_cropped, y_cropped = water.crop_spectrum(
+            crop_min, crop_max, wavenumbers, transmission
+        )
+        rows.append(
+            {
+                "file": sample.name,
+                "label": _label(sample, job_config),
+                "value": spectra.tot_transmission(
+                    x_cropped, y_cropped, band_min, band_max
+                ),
+            }
+        )
+    return rows
+
+
+def run_water_absorption(job_config: Dict, cache: ArrayCache) -> List[Dict]:
+    """% water absorption against a parabolic background fit (as in water.py)."""
+    window_min, window_max = job_config["water"]["window"]
+    rows = []
+    for path in config.expand_paths(job_config["water"]["files"]):
+        x_data, y_data = cache.read(path)
+        x_cropped, y_cropped = water.crop_spectrum(
+            window_min, window_max, x_data, y_data
+        )
+        x_top, y_top = water.take_peaks(x_cropped, y_cropped)
+        bkgd_params, _ = water.fit_bkgd(
+            x_top, y_top, water.parabola, job_config["water"]["para_guess"]
+        )
+        rows.append(
+            {
+                "file": path.name,
+                "label": _label(path, job_config),
+                "value": water.absorption(
+                    np.array(x_top), np.array(y_top), bkgd_params
+                ),
+            }
+        )
+    return rows
+
+
+def run_fft_bands(job_config: Dict, cache: ArrayCache) -> List[Dict]:
+    """Band integrals of single-beam spectra Fourier transformed from
+    interferograms (as in fourier.py and chunked.py)."""
+    windows = [tuple(window) for window in job_config["fft_bands"]["windows"]]
+    rows = []
+    for path in config.expand_paths(job_config["fft_bands"]["files"]):
+        spectrum_x, spectrum_y = cache.fft(path, job_config["fft"])
+        integrals = chunked.band_integrals(spectrum_x, spectrum_y, windows)[0]
+        for window, integral in zip(windows, integrals):
+            rows.append(
+                {
+                    "file": path.name,
+                    "label": _label(path, job_config),
+                    "window": str(window[0]) + "-" + str(window[1]),
+                    "value": integral,
+                }
+            )
+    return rows
+
+
+PIPELINES = {
+    "co2_transmission": run_co2_transmission,
+    "water_absorption": run_water_absorption,
+    "fft_bands": run_fft_bands,
+}
+
+
+def run_grid(analysis_config: Dict, cache: ArrayCache = None) -> pd.DataFrame:
+    """Runs the configured pipeline for every grid point, sharing cached
+    intermediate arrays between grid points.
+
+    Args:
+        analysis_config (Dict): Configuration from config.load_config.
+        cache (ArrayCache, optional): Cache to use. Defaults to a new cache.
+
+    Returns:
+        pd.DataFrame: One row per (grid point, file) result, with a column per
+            grid parameter.
+    """
+    if cache is None:
+        cache = ArrayCache()
+    pipeline = analysis_config["run"]["pipeline"]
+    if pipeline not in PIPELINES:
+        raise ValueError("pipeline must be one of " + ", ".join(PIPELINES))
+
+    rows = []
+    for point, job_config in config.expand_grid(analysis_config):
+        for row in PIPELINES[pipeline](job_config, cache):
+            row.update({key: str(value) for key, value in point.items()})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+
+    analysis_config = config.load_config(sys.argv[1] if len(sys.argv) > 1 else None)
+    cache_config = analysis_config["cache"]
+    array_cache = ArrayCache(
+        fftcache.FFTCache(
+            max_memory_mb=cache_config["memory_mb"],
+            cache_dir=cache_config["dir"] or None,
+            max_disk_mb=cache_config["disk_mb"],
+        )
+    )
+    df_results = run_grid(analysis_config, array_cache)
+    print(df_results)
+    print("stages computed:", array_cache.computed)
+    print("FFT cache:", array_cache.fft_cache.info())
+    if analysis_config["run"]["output"]:
+        df_results.to_csv(analysis_config["run"]["output"], index=False)
@@ -0,0 +1,277 @@
+"""
+timeresolved.py
+
+Time-resolved analysis of spectrum series (e.g. the evac-to-air runs of
+2022-02-07 and 2022-02-15). A series is stacked into one (time x wavenumber)
+matrix, on which difference spectra, band kinetics and an SVD/PCA decomposition
+are computed at once, and which is drawn as a single heat map.
+
+Author: Shiqi Xu
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+import chunked
+import config
+import results
+import spectra
+
+
+def _check_grid(
+    x_data: np.ndarray,
+    wavenumbers: np.ndarray,
+    path_csv: Union[str, Path],
+    path_first: Union[str, Path],
+):
+    """Raises ValueError if a file's wavenumber grid differs from the series'."""
+    if len(x_data) != len(wavenumbers) or not np.allclose(x_data, wavenumbers):
+        raise ValueError(
+            "wavenumber grid of " + str(path_csv) + " differs from " + str(path_first)
+        )
+
+
+def load_series(
+    paths_csv: Sequence[Union[str, Path]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Reads a series of spectra into a (time x wavenumber) matrix, ordered by the
+    time parsed from the filenames (e.g. "..._evac_to_air_05s.CSV").
+
+    Args:
+        paths_csv (Sequence[Union[str, Path]]): Paths to spectrum CSV files, all
+            on the same wavenumber grid.
+
+    Returns:
+        Tuple[np.ndarray[float], np.ndarray[float], np.ndarray[float]]: Times in
+            s, ascending wavenumber array in cm^{-1}, and 2-D array of intensity
+            data with one row per time.
+    """
+    times = []
+    for path in paths_csv:
+        time_s = results.parse_run_metadata(path)["time_s"]
+        if time_s is None:
+            raise ValueError("no time in filename: " + str(path))
+        times.append(time_s)
+    order = np.argsort(times, kind="stable")
+
+    wavenumbers, first = spectra.read_data(paths_csv[order[0]])
+    y_matrix = np.empty((len(order), len(first)))
+    y_matrix[0] = first
+    for i in range(1, len(order)):
+        x_data, y_data = spectra.read_data(paths_csv[order[i]])
+        _check_grid(x_data, wavenumbers, paths_csv[order[i]], paths_csv[order[0]])
+        y_matrix[i] = y_data
+
+    return np.asarray(times, dtype=np.float64)[order], wavenumbers, y_matrix
+
+
+def difference_spectra(
+    y_matrix: np.ndarray,
+    y_reference: np.ndarray = None,
+    absorbance: bool = True,
+    max_absorbance: float = 3,
+) -> np.ndarray:
+    """Difference spectra of every row of a series against a reference spectrum.
+
+    Args:
+        y_matrix (np.ndarray[float]): 2-D array of spectra, one per time.
+        y_reference (np.ndarray[float], optional): Reference spectrum, e.g. the
+            evacuated cell. Defaults to None (first row).
+        absorbance (bool, optional): If True, returns absorbance, -log10(I/I_ref);
+            otherwise returns I - I_ref. Defaults to True.
+        max_absorbance (float, optional): Limit on |absorbance|, where saturated
+            bands (e.g. CO2) leave I or I_ref at or below zero. Defaults to 3.
+
+    Returns:
+        np.ndarray[float]: Difference spectra, same shape as y_matrix.
+    """
+    if y_reference is None:
+        y_reference = y_matrix[0]
+    if absorbance:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.nan_to_num(y_matrix / y_reference, nan=0.0)
+        ratio = np.clip(ratio, 10.0**-max_absorbance, 10.0**max_absorbance)
+        return -np.log10(ratio)
+    return y_matrix - y_reference
+
+
+def band_kinetics(
+    times: np.ndarray,
+    wavenumber_data: np.ndarray,
+    y_matrix: np.ndarray,
+    windows: Sequence[Tuple[float, float]],
+) -> pd.DataFrame:
+    """Band integrals of every spectrum in a series, normalized by window width
+    (as in spectra.tot_transmission).
+
+    Args:
+        times (np.ndarray[float]): Time of each row, in s.
+        wavenumber_data (np.ndarray[float]): Ascending wavenumber array, in cm^{-1}.
+        y_matrix (np.ndarray[float]): 2-D array of spectra, one per time.
+        windows (Sequence[Tuple[float, float]]): (min, max) wavenumber windows.
+
+    Returns:
+        pd.DataFrame: Band integrals indexed by time, one column per window.
+    """
+    windows = [tuple(window) for window in windows]
+    integrals = chunked.band_integrals(wavenumber_data, y_matrix, windows)
+    columns = [str(window[0]) + "-" + str(window[1]) for window in windows]
+    kinetics = pd.DataFrame(integrals, index=times, columns=columns)
+    kinetics.index.name = "time_s"
+
+    return kinetics
+
+
+def decompose(y_matrix: np.ndarray, n_components: int = 3, centre: bool = True) -> Dict:
+    """SVD of a series (PCA if mean-centred), separating the spectral shapes that
+    change together over time.
+
+    Args:
+        y_matrix (np.ndarray[float]): 2-D array of spectra, one per time.
+        n_components (int, optional): Number of components kept. Defaults to 3.
+        centre (bool, optional): Subtract the mean spectrum first. Defaults to True.
+
+    Returns:
+        Dict: "singular_values" (all), "explained" (fraction of variance per
+            kept component), "spectra" (n_components x wavenumber), "scores"
+            (time x n_components) and "mean" (mean spectrum, or zeros).
+    """
+    y_matrix = np.nan_to_num(np.asarray(y_matrix, dtype=np.float64))
+    mean = y_matrix.mean(axis=0) if centre else np.zeros(y_matrix.shape[1])
+    u, s, vt = np.linalg.svd(y_matrix - mean, full_matrices=False)
+    n_components = min(n_components, len(s))
+    ## fix the sign of each component so it is reproducible
+    largest = np.argmax(np.abs(vt[:n_components]), axis=1)
+    signs = np.sign(vt[np.arange(n_components), largest])
+    variance = s**2
+
+    return {
+        "singular_values": s,
+        "explained": variance[:n_components] / np.sum(variance),
+        "spectra": vt[:n_components] * signs[:, None],
+        "scores": u[:, :n_components] * s[:n_components] * signs,
+        "mean": mean,
+    }
+
+
+def plot_spectrogram(
+    times: np.ndarray,
+    wavenumber_data: np.ndarray,
+    z_matrix: np.ndarray,
+    path_save: Union[str, Path],
+    title: str = "",
+    label: str = "Absorbance",
+    window: Tuple[float, float] = None,
+):
+    """Draws a series as one (time x wavenumber) heat map.
+
+    Args:
+        times (np.ndarray[float]): Time of each row, in s.
+        wavenumber_data (np.ndarray[float]): Ascending wavenumber array, in cm^{-1}.
+        z_matrix (np.ndarray[float]): 2-D array of values, one row per time.
+        path_save (Union[str, Path]): Path to save figure.
+        title (str, optional): Figure title. Defaults to "".
+        label (str, optional): Colour bar label. Defaults to "Absorbance".
+        window (Tuple[float, float], optional): Wavenumber range shown.
+            Defaults to None (full range).
+    """
+    if window is not None:
+        start = np.searchsorted(wavenumber_data, window[0], side="left")
+        end = np.searchsorted(wavenumber_data, window[1], side="right")
+        wavenumber_data = wavenumber_data[start:end]
+        z_matrix = z_matrix[:, start:end]
+    limit = np.nanpercentile(np.abs(z_matrix), 99.5)
+
+    fig = plt.figure(figsize=(10, 5))
+    mesh = plt.pcolormesh(
+        wavenumber_data,
+        times,
+        z_matrix,
+        shading="nearest",
+        cmap="RdBu_r",
+        vmin=-limit,
+        vmax=limit,
+    )
+    plt.colorbar(mesh, label=label)
+    plt.gca().invert_xaxis()
+    plt.title(title)
+    plt.xlabel("Wavenumber (cm$^{-1}$)")
+    plt.ylabel("Time (s)")
+    plt.tight_layout()
+    plt.savefig(path_save)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+
+    analysis_config = config.load_config(sys.argv[1] if len(sys.argv) > 1 else None)
+    time_config = analysis_config["time_resolved"]
+
+    output_path = Path.cwd() / "outputs" / "time_resolved"
+    try:
+        Path.mkdir(output_path)
+    except OSError:
+        pass
+
+    ## (name, series files, reference spectrum); run01 of 2022-02-15 has no
+    ## evacuated reference (see its README), so its first time step is used
+    data_220207 = Path.cwd() / "data" / "2022-02-07"
+    data_220215 = Path.cwd() / "data" / "2022-02-15"
+    series_list: List[Tuple[str, List[Path], Path]] = [
+        (
+            "2022-02-07_evac_to_air",
+            sorted(data_220207.glob("*_air_*s.CSV")),
+            data_220207 / "2022-02-07_run00_2.0res_evac.CSV",
+        ),
+        (
+            "2022-02-15_run01_evac_to_air",
+            sorted(data_220215.glob("2022-02-15_run01_*_evac_to_air_*s.CSV")),
+            None,
+        ),
+        (
+            "2022-02-15_run02_evac_to_air",
+            sorted(data_220215.glob("2022-02-15_run02_*_evac_to_air_*s.CSV")),
+            data_220215 / "2022-02-15_run02_4.0res_2scans_evac_-93kPa.CSV",
+        ),
+    ]
+
+    ## shared results store, as in analysis.py and snr.py
+    conn = results.connect(Path.cwd() / "outputs" / "results.sqlite")
+    for name, series_files, reference_file in series_list:
+        times, wavenumbers, y_matrix = load_series(series_files)
+        y_reference = None
+        if reference_file is not None:
+            x_reference, y_reference = spectra.read_data(reference_file)
+            _check_grid(x_reference, wavenumbers, reference_file, series_files[0])
+        diff_matrix = difference_spectra(y_matrix, y_reference)
+
+        kinetics = band_kinetics(
+            times, wavenumbers, diff_matrix, time_config["windows"]
+        )
+        components = decompose(diff_matrix, time_config["n_components"])
+        print(name)
+        print(kinetics)
+        print("explained variance:", np.round(components["explained"], 4))
+
+        ## kinetics go into the results store, one scalar per file and band
+        paths_by_time = sorted(
+            series_files, key=lambda path: results.parse_run_metadata(path)["time_s"]
+        )
+        for path, (_, row) in zip(paths_by_time, kinetics.iterrows()):
+            for column, value in row.items():
+                results.store_scalar(conn, path.name, "absorbance_" + column, value)
+
+        plot_spectrogram(
+            times,
+            wavenumbers,
+            diff_matrix,
+            output_path / (name + ".png"),
+            title=name,
+            window=time_config["plot_window"],
+        )
+    conn.close()
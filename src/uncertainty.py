@@ -0,0 +1,279 @@
+"""
+uncertainty.py
+
+Uncertainties on derived FTIR quantities: propagation of fit covariance into band
+integrals, and residual-bootstrap confidence intervals for water absorption and
+CO2 band transmission. Bootstrap draws are generated and evaluated in vectorized
+batches, optionally spread over a process pool; each batch has its own seeded
+random stream so results are reproducible for any number of workers.
+
+Author: Shiqi Xu
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Sequence, Tuple
+
+import numpy as np
+from scipy import integrate, signal
+
+
+def propagate_covariance(
+    func: Callable, params: Sequence[float], cov: np.ndarray, rel_step: float = 1e-6
+) -> Tuple[float, float]:
+    """Propagates a parameter covariance matrix through a scalar function, to first
+    order (sigma^2 = J C J^T), with a central-difference Jacobian.
+
+    Args:
+        func (Callable): Function of the parameter vector, returning a float.
+        params (Sequence[float]): Best-fit parameters.
+        cov (np.ndarray[float]): Parameter covariance matrix, e.g. from curve_fit.
+        rel_step (float, optional): Relative finite-difference step (absolute for
+            parameters equal to zero). Defaults to 1e-6.
+
+    Returns:
+        Tuple[float, float]: Function value at params, and its standard deviation.
+    """
+    params = np.asarray(params, dtype=np.float64)
+    jacobian = np.empty(len(params))
+    for k in range(len(params)):
+        ## relative to the parameter, which may be tiny (e.g. a parabola's
+        ## curvature); absolute only where the parameter is zero
+        step = rel_step * abs(params[k]) if params[k] != 0 else rel_step
+        params_up, params_down = params.copy(), params.copy()
+        params_up[k] += step
+        params_down[k] -= step
+        jacobian[k] = (func(params_up) - func(params_down)) / (2 * step)
+    variance = jacobian @ np.asarray(cov) @ jacobian
+
+    return float(func(params)), float(np.sqrt(max(variance, 0.0)))
+
+
+def band_integral_with_error(
+    x_data: np.ndarray,
+    func: Callable,
+    params: Sequence[float],
+    cov: np.ndarray,
+    min_wavenumber: float,
+    max_wavenumber: float,
+) -> Tuple[float, float]:
+    """Integrates a fitted model over a spectral window (normalized by window
+    width, as in spectra.tot_transmission), with the uncertainty propagated from
+    the fit covariance.
+
+    Args:
+        x_data (np.ndarray[float]): Ascending wavenumber data, in cm^{-1}.
+        func (Callable): Model function, func(x, *params).
+        params (Sequence[float]): Best-fit parameters.
+        cov (np.ndarray[float]): Parameter covariance matrix.
+        min_wavenumber (float): Lower wavenumber in spectral window.
+        max_wavenumber (float): Upper wavenumber in spectral window.
+
+    Returns:
+        Tuple[float, float]: Band integral and its standard deviation.
+    """
+    x_data = np.asarray(x_data, dtype=np.float64)
+    start = np.searchsorted(x_data, min_wavenumber, side="left")
+    end = start + np.searchsorted(x_data[start:], max_wavenumber, side="left")
+    x_cropped = x_data[start:end]
+
+    def band_integral(p):
+        return integrate.trapezoid(func(x_cropped, *p), x_cropped) / (
+            max_wavenumber - min_wavenumber
+        )
+
+    return propagate_covariance(band_integral, params, cov)
+
+
+def _positive_part_integral(x_data: np.ndarray, y_diff: np.ndarray) -> np.ndarray:
+    """Row-wise trapezoid integral over only the points where y_diff > 0, joining
+    consecutive kept points as water.absorption does. Vectorized over rows."""
+    n_points = y_diff.shape[-1]
+    kept = y_diff > 0
+    point_index = np.broadcast_to(np.arange(n_points), y_diff.shape)
+    ## index of the next kept point after each position (n_points if none)
+    kept_index = np.where(kept, point_index, n_points)
+    next_kept = np.minimum.accumulate(kept_index[..., ::-1], axis=-1)[..., ::-1]
+    next_kept = np.concatenate(
+        [next_kept[..., 1:], np.full(y_diff.shape[:-1] + (1,), n_points)], axis=-1
+    )
+    valid = kept & (next_kept < n_points)
+    next_safe = np.minimum(next_kept, n_points - 1)
+    y_next = np.take_along_axis(y_diff, next_safe, axis=-1)
+    segments = 0.5 * (x_data[next_safe] - x_data) * (y_diff + y_next)
+
+    return np.sum(np.where(valid, segments, 0.0), axis=-1)
+
+
+def _quadratic_design(x_data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Design matrix of a quadratic in centred x, and its pseudo-inverse. A
+    parabola a(x - x0)^2 + y0 spans the same model space, so linear least squares
+    on this basis reproduces the curve_fit optimum without initial guesses."""
+    x_centred = x_data - np.mean(x_data)
+    design = np.stack([np.ones_like(x_centred), x_centred, x_centred**2], axis=-1)
+    return design, np.linalg.pinv(design)
+
+
+def _water_batch(args) -> np.ndarray:
+    """Evaluates one batch of water absorption bootstrap draws."""
+    x_data, y_model, residuals, n_draws, seed = args
+    rng = np.random.default_rng(seed)
+    design, pinv = _quadratic_design(x_data)
+    draws = rng.choice(residuals, size=(n_draws, len(residuals)), replace=True)
+    y_boot = y_model + draws
+    y_fitted = (pinv @ y_boot.T).T @ design.T
+    absorbed = _positive_part_integral(x_data, y_fitted - y_boot)
+    total = integrate.trapezoid(y_fitted, x_data, axis=-1)
+
+    return absorbed / total * 100
+
+
+def _transmission_batch(args) -> np.ndarray:
+    """Evaluates one batch of band transmission bootstrap draws."""
+    x_data, y_model, residuals, n_draws, seed, width = args
+    rng = np.random.default_rng(seed)
+    draws = rng.choice(residuals, size=(n_draws, len(residuals)), replace=True)
+
+    return integrate.trapezoid(y_model + draws, x_data, axis=-1) / width
+
+
+def _run_batches(
+    batch_func: Callable,
+    fixed_args: tuple,
+    n_boot: int,
+    seed: int,
+    batch_size: int,
+    n_workers: int,
+) -> np.ndarray:
+    """Splits n_boot draws into seeded batches, and evaluates them serially or on
+    a process pool."""
+    n_batches = -(-n_boot // batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_batches)
+    sizes = [min(batch_size, n_boot - i * batch_size) for i in range(n_batches)]
+    jobs = [
+        fixed_args[:3] + (sizes[i], seeds[i]) + fixed_args[3:]
+        for i in range(n_batches)
+    ]
+    if n_workers is not None and n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            batches = list(executor.map(batch_func, jobs))
+    else:
+        batches = [batch_func(job) for job in jobs]
+
+    return np.concatenate(batches)
+
+
+def _summarize(estimate: float, samples: np.ndarray, level: float) -> Dict:
+    """Percentile confidence interval and standard error of bootstrap samples."""
+    alpha = (1 - level) / 2
+    lower, upper = np.percentile(samples, [100 * alpha, 100 * (1 - alpha)])
+    return {
+        "estimate": float(estimate),
+        "std_err": float(np.std(samples, ddof=1)),
+        "ci_lower": float(lower),
+        "ci_upper": float(upper),
+        "samples": samples,
+    }
+
+
+def bootstrap_water_absorption(
+    x_data: np.ndarray,
+    y_data: np.ndarray,
+    n_boot: int = 2000,
+    level: float = 0.95,
+    seed: int = 0,
+    batch_size: int = 500,
+    n_workers: int = None,
+) -> Dict:
+    """Residual-bootstrap confidence interval for water absorption, for the
+    background points and parabolic background model used in water.py.
+
+    Args:
+        x_data (np.ndarray[float]): Wavenumber data of background points (e.g. from
+            water.take_peaks).
+        y_data (np.ndarray[float]): Intensity data of background points.
+        n_boot (int, optional): Number of bootstrap draws. Defaults to 2000.
+        level (float, optional): Confidence level. Defaults to 0.95.
+        seed (int, optional): Random seed. Defaults to 0.
+        batch_size (int, optional): Draws evaluated together per batch.
+            Defaults to 500.
+        n_workers (int, optional): Number of worker processes. Defaults to None
+            (run in this process).
+
+    Returns:
+        Dict: "estimate" (% absorption), "std_err", "ci_lower", "ci_upper" and
+            "samples" (np.ndarray[float] of bootstrap replicates).
+    """
+    x_data = np.asarray(x_data, dtype=np.float64)
+    y_data = np.asarray(y_data, dtype=np.float64)
+    design, pinv = _quadratic_design(x_data)
+    y_model = design @ (pinv @ y_data)
+    residuals = y_data - y_model
+    estimate = (
+        _positive_part_integral(x_data, y_model - y_data)
+        / integrate.trapezoid(y_model, x_data)
+        * 100
+    )
+    samples = _run_batches(
+        _water_batch, (x_data, y_model, residuals), n_boot, seed, batch_size, n_workers
+    )
+
+    return _summarize(estimate, samples, level)
+
+
+def bootstrap_transmission(
+    wavenumber_data: np.ndarray,
+    transmission_data: np.ndarray,
+    min_wavenumber: float,
+    max_wavenumber: float,
+    smooth_points: int = 11,
+    n_boot: int = 2000,
+    level: float = 0.95,
+    seed: int = 0,
+    batch_size: int = 500,
+    n_workers: int = None,
+) -> Dict:
+    """Residual-bootstrap confidence interval for total % transmission over a
+    spectral window (spectra.tot_transmission). Residuals are taken about a
+    Savitzky-Golay smoothed spectrum.
+
+    Args:
+        wavenumber_data (np.ndarray[float]): Ascending wavenumber data.
+        transmission_data (np.ndarray[float]): % transmission data.
+        min_wavenumber (float): Lower wavenumber in spectral window.
+        max_wavenumber (float): Upper wavenumber in spectral window.
+        smooth_points (int, optional): Savitzky-Golay window length, in data points
+            (odd). Defaults to 11.
+        n_boot (int, optional): Number of bootstrap draws. Defaults to 2000.
+        level (float, optional): Confidence level. Defaults to 0.95.
+        seed (int, optional): Random seed. Defaults to 0.
+        batch_size (int, optional): Draws evaluated together per batch.
+            Defaults to 500.
+        n_workers (int, optional): Number of worker processes. Defaults to None
+            (run in this process).
+
+    Returns:
+        Dict: "estimate" (total % transmission), "std_err", "ci_lower", "ci_upper"
+            and "samples" (np.ndarray[float] of bootstrap replicates).
+    """
+    wavenumber_data = np.asarray(wavenumber_data, dtype=np.float64)
+    start = np.searchsorted(wavenumber_data, min_wavenumber, side="left")
+    end = start + np.searchsorted(
+        wavenumber_data[start:], max_wavenumber, side="left"
+    )
+    x_cropped = wavenumber_data[start:end]
+    y_cropped = np.asarray(transmission_data, dtype=np.float64)[start:end]
+    width = max_wavenumber - min_wavenumber
+
+    y_model = signal.savgol_filter(y_cropped, smooth_points, 3)
+    residuals = y_cropped - y_model
+    estimate = integrate.trapezoid(y_cropped, x_cropped) / width
+    samples = _run_batches(
+        _transmission_batch,
+        (x_cropped, y_model, residuals, width),
+        n_boot,
+        seed,
+        batch_size,
+        n_workers,
+    )
+
+    return _summarize(estimate, samples, level)
@@ -6,6 +6,7 @@ Functions for analysing H2O absorption in FTIR spectra.
 Author: Shiqi Xu
 """
 
+import sys
 from pathlib import Path
 from typing import Tuple, Union
 
@@ -15,7 +16,17 @@ import matplotlib.pyplot as plt
 from scipy import integrate
 from scipy.optimize import curve_fit
 
+import config
 import spectra
+import uncertainty
+
+
+def exponential(x, x0, y0, a, b):
+    return a * np.exp((x - x0) / b) + y0
+
+
+def parabola(x, x0, y0, a):
+    return a * (x - x0) ** 2 + y0
 
 
 def crop_spectrum(x_lower_bound, x_upper_bound, x_data, y_data):
@@ -75,8 +86,53 @@ def absorption(x_data, y_data, fitted_params):
     return absorp
 
 
+def absorption_with_error(x_data, y_data, fitted_params, cov):
+    """Calculates % absorption as in absorption, with the uncertainty propagated
+    from the parabolic background fit covariance.
+
+    Args:
+        x_data (np.ndarray[float]): Wavenumber data.
+        y_data (np.ndarray[float]): Intensity data.
+        fitted_params (Sequence[float]): Best-fit parabola parameters (x0, y0, a).
+        cov (np.ndarray[float]): Parameter covariance matrix, from fit_bkgd.
+
+    Returns:
+        Tuple[float, float]: % absorption and its standard deviation.
+    """
+    x_data = np.asarray(x_data, dtype=np.float64)
+    y_data = np.asarray(y_data, dtype=np.float64)
+
+    def absorp(p):
+        return absorption(x_data, y_data, p)
+
+    return uncertainty.propagate_covariance(absorp, fitted_params, cov)
+
+
+def baseline_absorption(x_data, y_data, y_baseline):
+    """Calculates % absorption against a precomputed baseline (e.g. from
+    baseline.correct_baseline), without fitting a background model.
+
+    Args:
+        x_data (np.ndarray[float]): Wavenumber data.
+        y_data (np.ndarray[float]): Spectrum, or 2-D array of spectra (one per row).
+        y_baseline (np.ndarray[float]): Baseline(s), same shape as y_data.
+
+    Returns:
+        Union[float, np.ndarray[float]]: % absorption, one value per spectrum.
+    """
+    y_diff = np.clip(y_baseline - y_data, 0, None)
+    absorbed_radiation = integrate.trapezoid(y_diff, x_data, axis=-1)
+    tot_radiation = integrate.trapezoid(y_baseline, x_data, axis=-1)
+    absorp = absorbed_radiation / tot_radiation * 100
+
+    return absorp
+
+
 if __name__ == "__main__":
 
+    analysis_config = config.load_config(sys.argv[1] if len(sys.argv) > 1 else None)
+    water_config = analysis_config["water"]
+
     data_path = Path.cwd() / "data" / "2022-02-15"
     data_files = []
     for csv_file in data_path.iterdir():
@@ -84,12 +140,6 @@ if __name__ == "__main__":
             data_files.append(csv_file)
     data_files.sort()
 
-    def exponential(x, x0, y0, a, b):
-        return a * np.exp((x - x0) / b) + y0
-
-    def parabola(x, x0, y0, a):
-        return a * (x - x0) ** 2 + y0
-
     output_path = Path.cwd() / "outputs" / "water"
     try:
         Path.mkdir(output_path)
@@ -99,22 +149,27 @@ if __name__ == "__main__":
     for i in range(len(data_files)):
     # for i in range(1):
         x_data, y_data = spectra.read_data(data_files[i])
-        x_range = [1970, 2140]
+        x_range = water_config["window"]
         x_cropped, y_cropped = crop_spectrum(x_range[0], x_range[1], x_data, y_data)
         x_top, y_top = take_peaks(x_cropped, y_cropped)
 
         # exp_guess = [x_top[0], y_top[0] - 1, 1.33e-100, -1]
         # bkgd_params, fit_cov = fit_bkgd(x_top, y_top, exponential, exp_guess)
-        para_guess = [2090, 8.57, 6.4e-7]
+        para_guess = water_config["para_guess"]
         bkgd_params, fit_cov = fit_bkgd(x_top, y_top, parabola, para_guess)
 
-        xx_fit = np.linspace(x_range[0], x_range[1], (x_range[1] - x_range[0]) * 2)
+        xx_fit = np.linspace(
+            x_range[0], x_range[1], int((x_range[1] - x_range[0]) * 2)
+        )
         # yy_fit = exponential(
         #     xx_fit, bkgd_params[0], bkgd_params[1], bkgd_params[2], bkgd_params[3]
         # )
         yy_fit = parabola(xx_fit, bkgd_params[0], bkgd_params[1], bkgd_params[2])
 
-        absorp = absorption(x_top, y_top, bkgd_params)
+        absorp, absorp_fit_err = absorption_with_error(
+            x_top, y_top, bkgd_params, fit_cov
+        )
+        absorp_bootstrap = uncertainty.bootstrap_water_absorption(x_top, y_top)
         # print("absorption: " + str(absorp) + "%")
 
         fig = plt.figure()
@@ -126,7 +181,20 @@ if __name__ == "__main__":
         plt.title("Background Fit for 2022-02-15_run02_" + str(data_files[i].name).split("_")[-1][:-4])
         plt.xlabel("Wavenumber (cm$^{-1}$)")
         plt.ylabel("Intensity (arbitrary units)")
-        plt.text(200, 100, "absorption: " + str(round(absorp, 4)) + "%", ha='center', va='center', transform=None)
+        plt.text(
+            200,
+            100,
+            "absorption: "
+            + str(round(absorp, 4))
+            + " ± "
+            + str(round(absorp_bootstrap["std_err"], 4))
+            + "% (bootstrap)\n± "
+            + str(round(absorp_fit_err, 4))
+            + "% (fit covariance)",
+            ha='center',
+            va='center',
+            transform=None,
+        )
 
         # plt.show()
         fig_name_list = str(data_files[i].name).split("_")
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import peaks
+
+## a wide band with two narrow bands inside it, and one outside
+BANDS = [
+    (3612.0, 20.0, "CO2", "nu1+nu3 combination"),
+    (3715.0, 20.0, "CO2", "2nu2+nu3 combination"),
+    (3756.0, 200.0, "H2O", "nu1/nu3 stretch"),
+    (4200.0, 10.0, "X", "isolated"),
+]
+
+
+def test_narrow_band_inside_wide_band():
+    assert list(peaks.assign_bands([3612.0, 3720.0], BANDS)) == [0, 1]
+
+
+def test_wide_band_when_narrow_band_misses():
+    ## nearest centres are the narrow bands, but only the wide window matches
+    assert list(peaks.assign_bands([3560.0, 3650.0, 3900.0], BANDS)) == [2, 2, 2]
+
+
+def test_outside_all_windows():
+    assert list(peaks.assign_bands([3000.0, 4100.0, 4300.0], BANDS)) == [-1, -1, -1]
+
+
+def test_reference_table():
+    assigned = peaks.assign_bands([1400.0, 3560.0, 3650.0])
+    species = [peaks.REFERENCE_BANDS[i][2] for i in assigned]
+    assert species == ["H2O", "H2O", "H2O"]
+    assert len(peaks.assign_bands(np.array([]))) == 0
+
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(0)
+    band_centres = np.sort(rng.uniform(500, 4000, 50))
+    half_widths = rng.uniform(5, 300, 50)
+    bands = [
+        (centre, half_width, "X", str(i))
+        for i, (centre, half_width) in enumerate(zip(band_centres, half_widths))
+    ]
+    centres = rng.uniform(300, 4200, 500)
+    inside = np.abs(centres[:, None] - band_centres) <= half_widths
+    distance = np.where(inside, np.abs(centres[:, None] - band_centres), np.inf)
+    expected = np.where(inside.any(axis=1), np.argmin(distance, axis=1), -1)
+    assert np.array_equal(peaks.assign_bands(centres, bands), expected)
+
+
+def test_find_features_gaussian_dip():
+    ## one Gaussian dip on a flat baseline, at the CO2 nu3 band
+    x_data = np.arange(2000, 2700, 0.5)
+    sigma, depth = 5.0, 0.4
+    y_data = 1 - depth * np.exp(-((x_data - 2349) ** 2) / (2 * sigma**2))
+    features = peaks.find_features(x_data, y_data, prominence=0.1)
+    assert len(features) == 1
+    feature = features.iloc[0]
+    assert feature["centre"] == 2349
+    assert np.isclose(feature["height"], 1 - depth)
+    assert np.isclose(feature["prominence"], depth)
+    assert np.isclose(feature["fwhm"], 2 * np.sqrt(2 * np.log(2)) * sigma, rtol=1e-2)
+    assert np.isclose(feature["area"], depth * sigma * np.sqrt(2 * np.pi), rtol=1e-3)
+    assert feature["species"] == "CO2"
+    assert feature["band"] == "nu3 asym. stretch"